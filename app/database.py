@@ -1,19 +1,70 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-import sys
-sys.path.append('..')
-from config import DATABASE_URL
+from sqlalchemy.pool import StaticPool
+from config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_QUERY_CACHE_SIZE
 
 # check_same_thread é necessário apenas para SQLite
 if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    if DATABASE_URL in ("sqlite://", "sqlite:///:memory:"):
+        # Banco em memória só existe dentro de uma conexão, que precisa ser compartilhada
+        engine = create_engine(
+            DATABASE_URL,
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+            query_cache_size=DB_QUERY_CACHE_SIZE
+        )
+    else:
+        engine = create_engine(
+            DATABASE_URL,
+            connect_args={"check_same_thread": False},
+            query_cache_size=DB_QUERY_CACHE_SIZE
+        )
+
+    @event.listens_for(engine, "connect")
+    def _configure_sqlite(dbapi_connection, connection_record):
+        # WAL permite que leituras (relatórios) rodem enquanto há escrita de registros
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.close()
 else:
-    engine = create_engine(DATABASE_URL)
+    # pre_ping descarta conexões mortas após ociosidade; recycle evita timeouts do servidor
+    engine = create_engine(
+        DATABASE_URL,
+        pool_pre_ping=True,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=1800,
+        query_cache_size=DB_QUERY_CACHE_SIZE
+    )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+
+def aquecer_pool():
+    """
+    Abre as conexões do pool antes das primeiras requisições (PostgreSQL).
+
+    O pool só conecta sob demanda; sem isso, as primeiras requisições pagam o
+    handshake TCP/TLS e a autenticação com o banco. No SQLite não há custo de conexão.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+    # Todas abertas ao mesmo tempo, senão o pool reutilizaria sempre a mesma
+    conexoes = []
+    try:
+        for _ in range(DB_POOL_SIZE):
+            conexoes.append(engine.connect())
+    finally:
+        for conn in conexoes:
+            conn.close()
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, Text, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, ForeignKey, Text, UniqueConstraint, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone, timedelta
 from app.database import Base
@@ -40,9 +40,26 @@ class User(Base):
     updated_at = Column(DateTime, default=now_brazil, onupdate=now_brazil)
 
     # Unique constraint: email único por curso (ou global se super admin)
+    # As constraints já geram os índices (email, curso_id) e (matricula, curso_id) usados no login/cadastro
     __table_args__ = (
         UniqueConstraint('email', 'curso_id', name='uq_user_email_curso'),
         UniqueConstraint('matricula', 'curso_id', name='uq_user_matricula_curso'),
+        # Filtros/contagens por curso e papel (estatísticas do super admin); também
+        # atende buscas só por curso_id, por ser o prefixo do índice
+        Index('ix_users_curso_is_admin', 'curso_id', 'is_admin'),
+        # Índice parcial para o login sem curso, que procura primeiro o super admin
+        Index(
+            'ix_users_email_super_admin', 'email',
+            sqlite_where=text('is_super_admin = 1'),
+            postgresql_where=text('is_super_admin = true')
+        ),
+        # Índice parcial da listagem de admins: cobre o filtro por papel e a ordenação por nome
+        # num único range scan. A condição precisa ser a mesma usada na consulta (list_admins)
+        Index(
+            'ix_users_staff', 'nome',
+            sqlite_where=text('is_admin = 1 OR is_super_admin = 1'),
+            postgresql_where=text('is_admin = true OR is_super_admin = true')
+        ),
     )
 
     curso = relationship("Curso", back_populates="usuarios")
@@ -65,6 +82,12 @@ class TimeRecord(Base):
     face_count = Column(Integer, nullable=True)     # Quantidade de rostos detectados
     location_id = Column(Integer, ForeignKey("locations.id"), nullable=True)  # Local onde registrou
 
+    # Índices para os filtros de relatório (usuário + período, ou só período)
+    __table_args__ = (
+        Index('ix_time_records_user_timestamp', 'user_id', 'timestamp'),
+        Index('ix_time_records_timestamp', 'timestamp'),
+    )
+
     usuario = relationship("User", back_populates="registros")
     local = relationship("Location")
 
@@ -90,8 +113,16 @@ class Location(Base):
     longitude = Column(Float, nullable=False)
     raio_metros = Column(Integer, default=100)
     ativo = Column(Boolean, default=True)
-    curso_id = Column(Integer, ForeignKey("cursos.id"), nullable=True)  # Cada local pertence a um curso
+    curso_id = Column(Integer, ForeignKey("cursos.id"), nullable=True, index=True)  # Cada local pertence a um curso
     created_at = Column(DateTime, default=now_brazil)
     updated_at = Column(DateTime, default=now_brazil, onupdate=now_brazil)
 
     curso = relationship("Curso", back_populates="locais")
+
+
+class Metadado(Base):
+    """Pares chave/valor de controle da aplicação (versão do schema, dados padrão criados)."""
+    __tablename__ = "ponto_meta"
+
+    chave = Column(String(50), primary_key=True)
+    valor = Column(String(255), nullable=False)
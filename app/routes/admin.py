@@ -1,22 +1,28 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import StreamingResponse, Response
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy.orm import Session, raiseload
+from sqlalchemy import and_, case, func, select, delete
+from pydantic import BaseModel, TypeAdapter
 from typing import List, Optional
 from datetime import datetime, date, timedelta
-import csv
-import io
+from itertools import groupby
+from concurrent.futures import ThreadPoolExecutor
 import os
-from app.database import get_db
+import tempfile
+import numpy as np
+from app.database import get_db, SessionLocal
 from app.models.models import User, TimeRecord, CompanySettings, Location
-from app.utils.auth import get_current_admin
+from app.utils.auth import get_current_admin, CurrentUser
+from app.utils.cache import TTLCache
+from app.utils.periodo import limites_periodo
+from app.routes.ponto import invalidar_cache_locais
 from config import DEFAULT_COMPANY_LATITUDE, DEFAULT_COMPANY_LONGITUDE, DEFAULT_ALLOWED_RADIUS_METERS
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.platypus import SimpleDocTemplate, LongTable, TableStyle, Paragraph, Spacer
 
 router = APIRouter(prefix="/admin", tags=["Administração"])
 
@@ -33,6 +39,10 @@ class UserListResponse(BaseModel):
         from_attributes = True
 
 
+# Valida listas inteiras de uma vez, sem um model_validate por item
+_USER_LIST = TypeAdapter(List[UserListResponse])
+
+
 class CompanySettingsUpdate(BaseModel):
     nome_empresa: Optional[str] = None
     latitude: Optional[float] = None
@@ -51,6 +61,10 @@ class CompanySettingsResponse(BaseModel):
         from_attributes = True
 
 
+# CompanySettings é uma linha única que quase nunca muda
+_settings_cache = TTLCache(ttl=60, maxsize=1)
+
+
 class RegistroRelatorio(BaseModel):
     id: int
     user_id: int
@@ -64,6 +78,23 @@ class RegistroRelatorio(BaseModel):
     face_detected: Optional[bool] = None
 
 
+_REGISTRO_RELATORIO_LIST = TypeAdapter(List[RegistroRelatorio])
+
+# Colunas lidas pelos relatórios, rotuladas com os campos de RegistroRelatorio
+_COLUNAS_RELATORIO = (
+    TimeRecord.id,
+    TimeRecord.user_id,
+    User.nome.label("nome_funcionario"),
+    User.matricula,
+    TimeRecord.tipo,
+    TimeRecord.timestamp,
+    TimeRecord.latitude,
+    TimeRecord.longitude,
+    TimeRecord.dentro_raio,
+    TimeRecord.face_detected,
+)
+
+
 class RelatorioResponse(BaseModel):
     registros: List[RegistroRelatorio]
     total_registros: int
@@ -86,17 +117,18 @@ class RelatorioResumoResponse(BaseModel):
 
 
 def calcular_horas_trabalhadas(registros: List[TimeRecord]) -> timedelta:
-    total = timedelta()
-    entrada = None
+    """Soma os intervalos entrada/saída. Os registros devem vir ordenados por timestamp (ORDER BY)."""
+    if len(registros) < 2:
+        return timedelta()
+
+    timestamps = np.array([r.timestamp for r in registros], dtype='datetime64[us]')
+    tipos = np.array([r.tipo for r in registros])
 
-    for reg in sorted(registros, key=lambda x: x.timestamp):
-        if reg.tipo == 'entrada':
-            entrada = reg.timestamp
-        elif reg.tipo == 'saida' and entrada:
-            total += reg.timestamp - entrada
-            entrada = None
+    # Uma saída só fecha intervalo quando o registro imediatamente anterior é uma entrada
+    pares = (tipos[:-1] == 'entrada') & (tipos[1:] == 'saida')
+    total = (timestamps[1:][pares] - timestamps[:-1][pares]).sum()
 
-    return total
+    return total.item()
 
 
 def formatar_horas(td: timedelta) -> str:
@@ -107,23 +139,28 @@ def formatar_horas(td: timedelta) -> str:
 
 
 @router.get("/users", response_model=List[UserListResponse])
-async def list_users(
+def list_users(
     db: Session = Depends(get_db),
-    current_admin: User = Depends(get_current_admin)
+    current_admin: CurrentUser = Depends(get_current_admin)
 ):
     # Super admin vê todos os usuários, admin comum só vê do seu curso
-    query = db.query(User)
+    # raiseload: a resposta usa só colunas de User; qualquer lazy load aqui seria N+1
+    query = db.query(User).options(raiseload('*'))
     if not current_admin.is_super_admin and current_admin.curso_id:
         query = query.filter(User.curso_id == current_admin.curso_id)
     users = query.order_by(User.nome).all()
-    return [UserListResponse.model_validate(u) for u in users]
+    return _USER_LIST.validate_python(users, from_attributes=True)
 
 
 @router.get("/settings", response_model=CompanySettingsResponse)
-async def get_settings(
+def get_settings(
     db: Session = Depends(get_db),
-    current_admin: User = Depends(get_current_admin)
+    current_admin: CurrentUser = Depends(get_current_admin)
 ):
+    cached = _settings_cache.get("settings")
+    if cached is not None:
+        return cached
+
     settings = db.query(CompanySettings).first()
     if not settings:
         settings = CompanySettings(
@@ -135,14 +172,17 @@ async def get_settings(
         db.add(settings)
         db.commit()
         db.refresh(settings)
-    return CompanySettingsResponse.model_validate(settings)
+
+    response = CompanySettingsResponse.model_validate(settings)
+    _settings_cache.set("settings", response)
+    return response
 
 
 @router.put("/settings", response_model=CompanySettingsResponse)
-async def update_settings(
+def update_settings(
     settings_data: CompanySettingsUpdate,
     db: Session = Depends(get_db),
-    current_admin: User = Depends(get_current_admin)
+    current_admin: CurrentUser = Depends(get_current_admin)
 ):
     settings = db.query(CompanySettings).first()
     if not settings:
@@ -165,26 +205,27 @@ async def update_settings(
 
     db.commit()
     db.refresh(settings)
+    _settings_cache.clear()
+    invalidar_cache_locais()
     return CompanySettingsResponse.model_validate(settings)
 
 
 @router.get("/relatorio", response_model=RelatorioResponse)
-async def get_relatorio(
+def get_relatorio(
     data_inicio: Optional[date] = None,
     data_fim: Optional[date] = None,
     user_id: Optional[int] = None,
     db: Session = Depends(get_db),
-    current_admin: User = Depends(get_current_admin)
+    current_admin: CurrentUser = Depends(get_current_admin)
 ):
     if not data_inicio:
         data_inicio = date.today().replace(day=1)
     if not data_fim:
         data_fim = date.today()
 
-    inicio = datetime.combine(data_inicio, datetime.min.time())
-    fim = datetime.combine(data_fim, datetime.max.time())
+    inicio, fim = limites_periodo(data_inicio, data_fim)
 
-    query = db.query(TimeRecord, User).join(User).filter(
+    stmt = select(*_COLUNAS_RELATORIO).join(User, TimeRecord.user_id == User.id).where(
         and_(
             TimeRecord.timestamp >= inicio,
             TimeRecord.timestamp <= fim
@@ -193,29 +234,14 @@ async def get_relatorio(
 
     # Filtra por curso se não for super admin
     if not current_admin.is_super_admin and current_admin.curso_id:
-        query = query.filter(User.curso_id == current_admin.curso_id)
+        stmt = stmt.where(User.curso_id == current_admin.curso_id)
 
     if user_id:
-        query = query.filter(TimeRecord.user_id == user_id)
+        stmt = stmt.where(TimeRecord.user_id == user_id)
 
-    results = query.order_by(TimeRecord.timestamp.desc()).all()
-
-    registros = []
-    user_ids = set()
-    for record, user in results:
-        user_ids.add(user.id)
-        registros.append(RegistroRelatorio(
-            id=record.id,
-            user_id=user.id,
-            nome_funcionario=user.nome,
-            matricula=user.matricula,
-            tipo=record.tipo,
-            timestamp=record.timestamp,
-            latitude=record.latitude,
-            longitude=record.longitude,
-            dentro_raio=record.dentro_raio,
-            face_detected=record.face_detected
-        ))
+    rows = db.execute(stmt.order_by(TimeRecord.timestamp.desc())).mappings().all()
+    registros = _REGISTRO_RELATORIO_LIST.validate_python(rows)
+    user_ids = set(r.user_id for r in registros)
 
     return RelatorioResponse(
         registros=registros,
@@ -225,49 +251,64 @@ async def get_relatorio(
 
 
 @router.get("/relatorio/resumo", response_model=RelatorioResumoResponse)
-async def get_relatorio_resumo(
+def get_relatorio_resumo(
     data_inicio: Optional[date] = None,
     data_fim: Optional[date] = None,
     db: Session = Depends(get_db),
-    current_admin: User = Depends(get_current_admin)
+    current_admin: CurrentUser = Depends(get_current_admin)
 ):
     if not data_inicio:
         data_inicio = date.today().replace(day=1)
     if not data_fim:
         data_fim = date.today()
 
-    inicio = datetime.combine(data_inicio, datetime.min.time())
-    fim = datetime.combine(data_fim, datetime.max.time())
+    inicio, fim = limites_periodo(data_inicio, data_fim)
+
+    filtros = [
+        User.ativo == True,
+        TimeRecord.timestamp >= inicio,
+        TimeRecord.timestamp <= fim
+    ]
 
     # Filtra por curso se não for super admin
-    query = db.query(User).filter(User.ativo == True)
     if not current_admin.is_super_admin and current_admin.curso_id:
-        query = query.filter(User.curso_id == current_admin.curso_id)
-    users = query.all()
+        filtros.append(User.curso_id == current_admin.curso_id)
+
+    # Dias trabalhados e registros fora do raio são agregados pelo banco
+    totais = db.query(
+        User.id,
+        User.nome,
+        User.matricula,
+        func.count(func.distinct(func.date(TimeRecord.timestamp))).label("dias_trabalhados"),
+        func.sum(case((TimeRecord.dentro_raio == True, 0), else_=1)).label("registros_fora_raio")
+    ).join(User, TimeRecord.user_id == User.id).filter(
+        and_(*filtros)
+    ).group_by(User.id, User.nome, User.matricula).order_by(User.id).all()
+
+    # As horas dependem do pareamento entrada/saída, então busca só tipo e horário
+    registros = db.query(
+        TimeRecord.user_id, TimeRecord.tipo, TimeRecord.timestamp
+    ).join(User, TimeRecord.user_id == User.id).filter(
+        and_(*filtros)
+    ).order_by(TimeRecord.user_id, TimeRecord.timestamp).all()
+
+    registros_por_usuario = {
+        user_id: list(grupo)
+        for user_id, grupo in groupby(registros, key=lambda r: r.user_id)
+    }
 
     funcionarios = []
-    for user in users:
-        registros = db.query(TimeRecord).filter(
-            and_(
-                TimeRecord.user_id == user.id,
-                TimeRecord.timestamp >= inicio,
-                TimeRecord.timestamp <= fim
-            )
-        ).order_by(TimeRecord.timestamp).all()
-
-        if registros:
-            total_horas = calcular_horas_trabalhadas(registros)
-            dias_unicos = set(r.timestamp.date() for r in registros)
-            fora_raio = sum(1 for r in registros if not r.dentro_raio)
-
-            funcionarios.append(ResumoFuncionario(
-                user_id=user.id,
-                nome=user.nome,
-                matricula=user.matricula,
-                total_horas=formatar_horas(total_horas),
-                dias_trabalhados=len(dias_unicos),
-                registros_fora_raio=fora_raio
-            ))
+    for total in totais:
+        total_horas = calcular_horas_trabalhadas(registros_por_usuario.get(total.id, []))
+
+        funcionarios.append(ResumoFuncionario(
+            user_id=total.id,
+            nome=total.nome,
+            matricula=total.matricula,
+            total_horas=formatar_horas(total_horas),
+            dias_trabalhados=total.dias_trabalhados,
+            registros_fora_raio=total.registros_fora_raio
+        ))
 
     return RelatorioResumoResponse(
         periodo_inicio=data_inicio,
@@ -276,23 +317,33 @@ async def get_relatorio_resumo(
     )
 
 
+def _csv_campo(valor) -> str:
+    """Formata um campo como o csv.writer padrão (aspas só quando necessário)."""
+    texto = str(valor)
+    if ',' in texto or '"' in texto or '\r' in texto or '\n' in texto:
+        return '"' + texto.replace('"', '""') + '"'
+    return texto
+
+
+def _csv_linha(valores) -> str:
+    return ",".join(map(_csv_campo, valores)) + "\r\n"
+
+
 @router.get("/relatorio/export")
-async def export_relatorio(
+def export_relatorio(
     data_inicio: Optional[date] = None,
     data_fim: Optional[date] = None,
     user_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_admin: User = Depends(get_current_admin)
+    current_admin: CurrentUser = Depends(get_current_admin)
 ):
     if not data_inicio:
         data_inicio = date.today().replace(day=1)
     if not data_fim:
         data_fim = date.today()
 
-    inicio = datetime.combine(data_inicio, datetime.min.time())
-    fim = datetime.combine(data_fim, datetime.max.time())
+    inicio, fim = limites_periodo(data_inicio, data_fim)
 
-    query = db.query(TimeRecord, User).join(User).filter(
+    stmt = select(*_COLUNAS_RELATORIO).join(User, TimeRecord.user_id == User.id).where(
         and_(
             TimeRecord.timestamp >= inicio,
             TimeRecord.timestamp <= fim
@@ -301,42 +352,61 @@ async def export_relatorio(
 
     # Filtra por curso se não for super admin
     if not current_admin.is_super_admin and current_admin.curso_id:
-        query = query.filter(User.curso_id == current_admin.curso_id)
+        stmt = stmt.where(User.curso_id == current_admin.curso_id)
 
     if user_id:
-        query = query.filter(TimeRecord.user_id == user_id)
-
-    results = query.order_by(TimeRecord.timestamp).all()
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow([
-        'Data', 'Hora', 'Aluno', 'Matrícula', 'Tipo',
-        'Latitude', 'Longitude', 'Dentro do Raio'
-    ])
-
-    for record, user in results:
-        writer.writerow([
-            record.timestamp.strftime('%d/%m/%Y'),
-            record.timestamp.strftime('%H:%M:%S'),
-            user.nome,
-            user.matricula,
-            record.tipo.upper(),
-            record.latitude or '',
-            record.longitude or '',
-            'Sim' if record.dentro_raio else 'Não'
-        ])
+        stmt = stmt.where(TimeRecord.user_id == user_id)
+
+    stmt = stmt.order_by(TimeRecord.timestamp).execution_options(yield_per=1000)
+
+    def gerar_csv():
+        yield _csv_linha([
+            'Data', 'Hora', 'Aluno', 'Matrícula', 'Tipo',
+            'Latitude', 'Longitude', 'Dentro do Raio'
+        ]).encode('utf-8')
+
+        # A sessão da dependência já foi fechada quando o corpo é enviado,
+        # então o gerador abre a sua própria enquanto percorre o resultado
+        db = SessionLocal()
+        try:
+            for partition in db.execute(stmt).partitions():
+                yield "".join(
+                    _csv_linha([
+                        record.timestamp.strftime('%d/%m/%Y'),
+                        record.timestamp.strftime('%H:%M:%S'),
+                        record.nome_funcionario,
+                        record.matricula,
+                        record.tipo.upper(),
+                        record.latitude or '',
+                        record.longitude or '',
+                        'Sim' if record.dentro_raio else 'Não'
+                    ])
+                    for record in partition
+                ).encode('utf-8')
+        finally:
+            db.close()
 
-    output.seek(0)
     filename = f"relatorio_ponto_{data_inicio.strftime('%Y%m%d')}_{data_fim.strftime('%Y%m%d')}.csv"
 
     return StreamingResponse(
-        iter([output.getvalue()]),
+        gerar_csv(),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
 
+DELETE_BATCH_SIZE = 500
+
+
+def _remover_arquivo(path: str) -> bool:
+    """Remove um arquivo, retornando True se ele existia."""
+    try:
+        os.unlink(path)
+        return True
+    except OSError:
+        return False  # Ignora arquivos inexistentes e erros ao deletar
+
+
 class DeleteResponse(BaseModel):
     message: str
     registros_deletados: int
@@ -344,39 +414,51 @@ class DeleteResponse(BaseModel):
 
 
 @router.delete("/registros", response_model=DeleteResponse)
-async def delete_registros(
+def delete_registros(
     data_inicio: date,
     data_fim: date,
     user_id: Optional[int] = None,
     db: Session = Depends(get_db),
-    current_admin: User = Depends(get_current_admin)
+    current_admin: CurrentUser = Depends(get_current_admin)
 ):
     """Apaga registros de ponto em lote por período e opcionalmente por usuário."""
-    inicio = datetime.combine(data_inicio, datetime.min.time())
-    fim = datetime.combine(data_fim, datetime.max.time())
+    inicio, fim = limites_periodo(data_inicio, data_fim)
+
+    filtros = [
+        TimeRecord.timestamp >= inicio,
+        TimeRecord.timestamp <= fim
+    ]
 
     # Se não for super admin, filtra por usuários do curso
     if not current_admin.is_super_admin and current_admin.curso_id:
-        user_ids_curso = db.query(User.id).filter(User.curso_id == current_admin.curso_id).subquery()
-        query = db.query(TimeRecord).filter(
-            and_(
-                TimeRecord.timestamp >= inicio,
-                TimeRecord.timestamp <= fim,
-                TimeRecord.user_id.in_(user_ids_curso)
-            )
-        )
-    else:
-        query = db.query(TimeRecord).filter(
-            and_(
-                TimeRecord.timestamp >= inicio,
-                TimeRecord.timestamp <= fim
-            )
-        )
+        user_ids_curso = select(User.id).where(User.curso_id == current_admin.curso_id)
+        filtros.append(TimeRecord.user_id.in_(user_ids_curso))
 
     if user_id:
-        query = query.filter(TimeRecord.user_id == user_id)
-
-    registros = query.all()
+        filtros.append(TimeRecord.user_id == user_id)
+
+    if db.get_bind().dialect.delete_returning:
+        # Apaga e obtém os caminhos das fotos em um único comando (DELETE ... RETURNING)
+        registros = db.execute(
+            delete(TimeRecord)
+            .where(and_(*filtros))
+            .returning(TimeRecord.id, TimeRecord.foto_path)
+            .execution_options(synchronize_session=False)
+        ).all()
+    else:
+        # Busca apenas id e caminho da foto, sem carregar os objetos completos
+        registros = db.execute(
+            select(TimeRecord.id, TimeRecord.foto_path).where(and_(*filtros))
+        ).all()
+
+        # Deleta registros do banco (em lotes para respeitar o limite de parâmetros)
+        ids = [r.id for r in registros]
+        for i in range(0, len(ids), DELETE_BATCH_SIZE):
+            db.execute(
+                delete(TimeRecord)
+                .where(TimeRecord.id.in_(ids[i:i + DELETE_BATCH_SIZE]))
+                .execution_options(synchronize_session=False)
+            )
 
     if not registros:
         raise HTTPException(
@@ -384,22 +466,17 @@ async def delete_registros(
             detail="Nenhum registro encontrado no período especificado"
         )
 
+    db.commit()
+
+    # Remove os arquivos de foto em paralelo
+    fotos = [r.foto_path for r in registros if r.foto_path]
     fotos_deletadas = 0
-    for registro in registros:
-        # Remove arquivo de foto se existir
-        if registro.foto_path and os.path.exists(registro.foto_path):
-            try:
-                os.remove(registro.foto_path)
-                fotos_deletadas += 1
-            except Exception:
-                pass  # Ignora erros ao deletar arquivos
+    if fotos:
+        with ThreadPoolExecutor(max_workers=min(16, len(fotos))) as executor:
+            fotos_deletadas = sum(executor.map(_remover_arquivo, fotos))
 
     registros_count = len(registros)
 
-    # Deleta registros do banco
-    query.delete(synchronize_session=False)
-    db.commit()
-
     return DeleteResponse(
         message=f"Registros deletados com sucesso",
         registros_deletados=registros_count,
@@ -407,13 +484,40 @@ async def delete_registros(
     )
 
 
+PDF_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Estilos do PDF montados uma única vez
+_PDF_STYLES = getSampleStyleSheet()
+
+_PDF_TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_PDF_STYLES['Heading1'],
+    fontSize=16,
+    spaceAfter=20,
+    alignment=1  # Center
+)
+
+_PDF_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.Color(0.24, 0.48, 0.48)),  # Cor PUC
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ('FONTSIZE', (0, 1), (-1, -1), 8),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.Color(0.95, 0.95, 0.95)]),
+])
+
+
 @router.get("/relatorio/export/pdf")
-async def export_relatorio_pdf(
+def export_relatorio_pdf(
     data_inicio: Optional[date] = None,
     data_fim: Optional[date] = None,
     user_id: Optional[int] = None,
     db: Session = Depends(get_db),
-    current_admin: User = Depends(get_current_admin)
+    current_admin: CurrentUser = Depends(get_current_admin)
 ):
     """Exporta relatório em formato PDF."""
     if not data_inicio:
@@ -421,10 +525,9 @@ async def export_relatorio_pdf(
     if not data_fim:
         data_fim = date.today()
 
-    inicio = datetime.combine(data_inicio, datetime.min.time())
-    fim = datetime.combine(data_fim, datetime.max.time())
+    inicio, fim = limites_periodo(data_inicio, data_fim)
 
-    query = db.query(TimeRecord, User).join(User).filter(
+    query = db.query(*_COLUNAS_RELATORIO).join(User, TimeRecord.user_id == User.id).filter(
         and_(
             TimeRecord.timestamp >= inicio,
             TimeRecord.timestamp <= fim
@@ -438,12 +541,10 @@ async def export_relatorio_pdf(
     if user_id:
         query = query.filter(TimeRecord.user_id == user_id)
 
-    results = query.order_by(TimeRecord.timestamp).all()
-
-    # Cria PDF
-    buffer = io.BytesIO()
+    # Cria PDF (relatórios pequenos ficam em memória, grandes vão para disco)
+    arquivo = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_SIZE)
     doc = SimpleDocTemplate(
-        buffer,
+        arquivo,
         pagesize=landscape(A4),
         rightMargin=1*cm,
         leftMargin=1*cm,
@@ -452,19 +553,11 @@ async def export_relatorio_pdf(
     )
 
     elements = []
-    styles = getSampleStyleSheet()
 
     # Título
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=20,
-        alignment=1  # Center
-    )
     title = Paragraph(
         f"Relatório de Presença<br/>{data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}",
-        title_style
+        _PDF_TITLE_STYLE
     )
     elements.append(title)
     elements.append(Spacer(1, 0.5*cm))
@@ -472,7 +565,7 @@ async def export_relatorio_pdf(
     # Tabela de dados
     data = [['Data', 'Hora', 'Aluno', 'Matrícula', 'Tipo', 'Localização', 'Raio', 'Rosto']]
 
-    for record, user in results:
+    for record in query.order_by(TimeRecord.timestamp).yield_per(500):
         face_status = ''
         if record.face_detected is not None:
             face_status = 'Sim' if record.face_detected else 'Não'
@@ -480,48 +573,40 @@ async def export_relatorio_pdf(
         data.append([
             record.timestamp.strftime('%d/%m/%Y'),
             record.timestamp.strftime('%H:%M'),
-            user.nome[:25],  # Limita tamanho do nome
-            user.matricula,
+            record.nome_funcionario[:25],  # Limita tamanho do nome
+            record.matricula,
             record.tipo.upper(),
             f"{record.latitude:.4f}, {record.longitude:.4f}" if record.latitude else '-',
             'OK' if record.dentro_raio else 'Fora',
             face_status
         ])
 
-    # Estilo da tabela
-    table = Table(data, repeatRows=1)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.Color(0.24, 0.48, 0.48)),  # Cor PUC
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.Color(0.95, 0.95, 0.95)]),
-    ]))
+    total_registros = len(data) - 1
+
+    # LongTable é otimizada para tabelas que ocupam várias páginas
+    table = LongTable(data, repeatRows=1)
+    table.setStyle(_PDF_TABLE_STYLE)
 
     elements.append(table)
 
     # Resumo
     elements.append(Spacer(1, 1*cm))
     summary = Paragraph(
-        f"<b>Total de registros:</b> {len(results)}",
-        styles['Normal']
+        f"<b>Total de registros:</b> {total_registros}",
+        _PDF_STYLES['Normal']
     )
     elements.append(summary)
 
     doc.build(elements)
-    buffer.seek(0)
+    arquivo.seek(0)
 
     filename = f"relatorio_presenca_{data_inicio.strftime('%Y%m%d')}_{data_fim.strftime('%Y%m%d')}.pdf"
 
-    return Response(
-        content=buffer.getvalue(),
+    return StreamingResponse(
+        iter(lambda: arquivo.read(64 * 1024), b''),
         media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+        background=BackgroundTask(arquivo.close)
     )
 
 
@@ -554,25 +639,28 @@ class LocationResponse(BaseModel):
         from_attributes = True
 
 
+_LOCATION_LIST = TypeAdapter(List[LocationResponse])
+
+
 @router.get("/locations", response_model=List[LocationResponse])
-async def list_locations(
+def list_locations(
     db: Session = Depends(get_db),
-    current_admin: User = Depends(get_current_admin)
+    current_admin: CurrentUser = Depends(get_current_admin)
 ):
     """Lista todos os locais cadastrados do curso."""
-    query = db.query(Location)
+    query = db.query(Location).options(raiseload('*'))
     # Filtra por curso se não for super admin
     if not current_admin.is_super_admin and current_admin.curso_id:
         query = query.filter(Location.curso_id == current_admin.curso_id)
     locations = query.order_by(Location.nome).all()
-    return [LocationResponse.model_validate(loc) for loc in locations]
+    return _LOCATION_LIST.validate_python(locations, from_attributes=True)
 
 
 @router.post("/locations", response_model=LocationResponse)
-async def create_location(
+def create_location(
     location_data: LocationCreate,
     db: Session = Depends(get_db),
-    current_admin: User = Depends(get_current_admin)
+    current_admin: CurrentUser = Depends(get_current_admin)
 ):
     """Cria um novo local para o curso do admin."""
     # Define o curso_id baseado no admin (super admin pode não ter curso)
@@ -588,15 +676,16 @@ async def create_location(
     db.add(location)
     db.commit()
     db.refresh(location)
+    invalidar_cache_locais()
     return LocationResponse.model_validate(location)
 
 
 @router.put("/locations/{location_id}", response_model=LocationResponse)
-async def update_location(
+def update_location(
     location_id: int,
     location_data: LocationUpdate,
     db: Session = Depends(get_db),
-    current_admin: User = Depends(get_current_admin)
+    current_admin: CurrentUser = Depends(get_current_admin)
 ):
     """Atualiza um local existente."""
     location = db.query(Location).filter(Location.id == location_id).first()
@@ -626,14 +715,15 @@ async def update_location(
 
     db.commit()
     db.refresh(location)
+    invalidar_cache_locais()
     return LocationResponse.model_validate(location)
 
 
 @router.delete("/locations/{location_id}")
-async def delete_location(
+def delete_location(
     location_id: int,
     db: Session = Depends(get_db),
-    current_admin: User = Depends(get_current_admin)
+    current_admin: CurrentUser = Depends(get_current_admin)
 ):
     """Remove um local."""
     location = db.query(Location).filter(Location.id == location_id).first()
@@ -652,4 +742,5 @@ async def delete_location(
 
     db.delete(location)
     db.commit()
+    invalidar_cache_locais()
     return {"message": "Local removido com sucesso"}
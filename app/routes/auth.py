@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import case, func, insert, or_
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 from datetime import timedelta
@@ -11,7 +12,9 @@ from app.utils.auth import (
     get_password_hash,
     create_access_token,
     get_current_user,
-    get_current_admin
+    get_current_admin,
+    invalidar_usuario,
+    CurrentUser
 )
 from config import ACCESS_TOKEN_EXPIRE_MINUTES
 
@@ -55,29 +58,104 @@ class TokenResponse(BaseModel):
     user: UserResponse
 
 
-@router.post("/login", response_model=TokenResponse)
-async def login(
+def verificar_email_matricula_disponiveis(
+    db: Session,
+    email: str,
+    matricula: str,
+    curso_id: Optional[int]
+) -> None:
+    """
+    Verifica em uma única consulta se email ou matrícula já estão cadastrados
+    no curso (ou globalmente, quando curso_id é None).
+
+    A consulta devolve só duas flags agregadas (MAX(CASE ...) funciona em
+    SQLite e Postgres), sem trazer as linhas encontradas.
+    """
+    query = db.query(
+        func.max(case((User.email == email, 1), else_=0)).label("email_existe"),
+        func.max(case((User.matricula == matricula, 1), else_=0)).label("matricula_existe")
+    ).filter(
+        or_(User.email == email, User.matricula == matricula)
+    )
+    if curso_id:
+        query = query.filter(User.curso_id == curso_id)
+    flags = query.one()
+
+    sufixo = " neste curso" if curso_id else ""
+    if flags.email_existe:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email já cadastrado" + sufixo
+        )
+    if flags.matricula_existe:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Matrícula já cadastrada" + sufixo
+        )
+
+
+# Colunas de UserResponse devolvidas pelo INSERT ... RETURNING
+_COLUNAS_USUARIO = (
+    User.id,
+    User.nome,
+    User.email,
+    User.matricula,
+    User.is_admin,
+    User.is_super_admin,
+    User.ativo,
+    User.curso_id,
+)
+
+
+def inserir_usuario(db: Session, **valores) -> UserResponse:
+    """
+    Grava um novo usuário e monta a resposta.
+
+    Com INSERT ... RETURNING os valores gravados voltam no próprio comando,
+    sem o SELECT extra do db.refresh().
+    """
+    if db.get_bind().dialect.insert_returning:
+        row = db.execute(insert(User).values(**valores).returning(*_COLUNAS_USUARIO)).one()
+        db.commit()
+        return UserResponse.model_validate(row)
+
+    new_user = User(**valores)
+    db.add(new_user)
+    db.commit()
+    db.refresh(new_user)
+    return UserResponse.model_validate(new_user)
+
+
+# As rotas abaixo já devolvem o modelo validado; response_model=None evita que o
+# FastAPI valide a resposta de novo (o schema continua documentado em `responses`)
+@router.post("/login", response_model=None, responses={200: {"model": TokenResponse}})
+def login(
     login_data: LoginRequest,
     response: Response,
     db: Session = Depends(get_db)
 ):
+    # O curso vem no mesmo SELECT (JOIN), pois é usado na resposta
+    user_query = db.query(User).options(joinedload(User.curso))
+
     # Se curso_id especificado, busca usuário no curso específico
     if login_data.curso_id:
-        user = db.query(User).filter(
+        user = user_query.filter(
             User.email == login_data.email,
             User.curso_id == login_data.curso_id
         ).first()
     else:
         # Login sem curso_id - busca primeiro por super admin, depois por qualquer usuário
-        user = db.query(User).filter(
+        user = user_query.filter(
             User.email == login_data.email,
             User.is_super_admin == True
         ).first()
         if not user:
             # Fallback para usuário comum (compatibilidade com login antigo)
-            user = db.query(User).filter(User.email == login_data.email).first()
+            user = user_query.filter(User.email == login_data.email).first()
 
-    if not user or not verify_password(login_data.senha, user.senha_hash):
+    # verify_password roda o bcrypt mesmo sem usuário (tempo de resposta constante)
+    senha_ok = verify_password(login_data.senha, user.senha_hash if user else None)
+    if not user or not senha_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email ou senha incorretos"
@@ -102,14 +180,9 @@ async def login(
         samesite="lax"
     )
 
-    # Busca informações do curso para a resposta
-    curso_slug = None
-    curso_nome = None
-    if user.curso_id:
-        curso = db.query(Curso).filter(Curso.id == user.curso_id).first()
-        if curso:
-            curso_slug = curso.slug
-            curso_nome = curso.nome
+    # Informações do curso para a resposta (já carregadas pelo joinedload)
+    curso_slug = user.curso.slug if user.curso else None
+    curso_nome = user.curso.nome if user.curso else None
 
     user_response = UserResponse(
         id=user.id,
@@ -137,43 +210,26 @@ async def logout(response: Response):
     return {"message": "Logout realizado com sucesso"}
 
 
-@router.get("/me", response_model=UserResponse)
-async def get_me(current_user: User = Depends(get_current_user)):
+@router.get("/me", response_model=None, responses={200: {"model": UserResponse}})
+async def get_me(current_user: CurrentUser = Depends(get_current_user)):
     return UserResponse.model_validate(current_user)
 
 
-@router.post("/register", response_model=UserResponse)
-async def register_user(
+@router.post("/register", response_model=None, responses={200: {"model": UserResponse}})
+def register_user(
     user_data: UserCreate,
     db: Session = Depends(get_db),
-    current_admin: User = Depends(get_current_admin)
+    current_admin: CurrentUser = Depends(get_current_admin)
 ):
     # Determina o curso_id: usa o especificado ou herda do admin
     curso_id = user_data.curso_id
     if curso_id is None and not current_admin.is_super_admin:
         curso_id = current_admin.curso_id
 
-    # Verifica se email já existe no curso
-    email_query = db.query(User).filter(User.email == user_data.email)
-    if curso_id:
-        email_query = email_query.filter(User.curso_id == curso_id)
-    if email_query.first():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email já cadastrado" + (" neste curso" if curso_id else "")
-        )
+    verificar_email_matricula_disponiveis(db, user_data.email, user_data.matricula, curso_id)
 
-    # Verifica se matrícula já existe no curso
-    matricula_query = db.query(User).filter(User.matricula == user_data.matricula)
-    if curso_id:
-        matricula_query = matricula_query.filter(User.curso_id == curso_id)
-    if matricula_query.first():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Matrícula já cadastrada" + (" neste curso" if curso_id else "")
-        )
-
-    new_user = User(
+    return inserir_usuario(
+        db,
         nome=user_data.nome,
         email=user_data.email,
         matricula=user_data.matricula,
@@ -182,18 +238,16 @@ async def register_user(
         curso_id=curso_id
     )
 
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-
-    return UserResponse.model_validate(new_user)
-
 
-@router.put("/users/{user_id}/toggle-active", response_model=UserResponse)
-async def toggle_user_active(
+@router.put(
+    "/users/{user_id}/toggle-active",
+    response_model=None,
+    responses={200: {"model": UserResponse}}
+)
+def toggle_user_active(
     user_id: int,
     db: Session = Depends(get_db),
-    current_admin: User = Depends(get_current_admin)
+    current_admin: CurrentUser = Depends(get_current_admin)
 ):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
@@ -218,6 +272,7 @@ async def toggle_user_active(
     user.ativo = not user.ativo
     db.commit()
     db.refresh(user)
+    invalidar_usuario(user.id)
 
     return UserResponse.model_validate(user)
 
@@ -239,15 +294,15 @@ class CursoPublico(BaseModel):
         from_attributes = True
 
 
-@router.get("/cursos", response_model=list[CursoPublico])
-async def list_cursos_publicos(db: Session = Depends(get_db)):
+@router.get("/cursos", response_model=None, responses={200: {"model": list[CursoPublico]}})
+def list_cursos_publicos(db: Session = Depends(get_db)):
     """Lista cursos disponíveis para cadastro (endpoint público)."""
     cursos = db.query(Curso).filter(Curso.ativo == True).order_by(Curso.nome).all()
     return [CursoPublico.model_validate(c) for c in cursos]
 
 
-@router.post("/signup", response_model=UserResponse)
-async def signup(
+@router.post("/signup", response_model=None, responses={200: {"model": UserResponse}})
+def signup(
     user_data: SignupRequest,
     db: Session = Depends(get_db)
 ):
@@ -264,42 +319,13 @@ async def signup(
                 detail="Curso não encontrado ou inativo"
             )
 
-        # Verifica se email já existe no curso
-        if db.query(User).filter(
-            User.email == user_data.email,
-            User.curso_id == user_data.curso_id
-        ).first():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email já cadastrado neste curso"
-            )
-
-        # Verifica se matrícula já existe no curso
-        if db.query(User).filter(
-            User.matricula == user_data.matricula,
-            User.curso_id == user_data.curso_id
-        ).first():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Matrícula já cadastrada neste curso"
-            )
-    else:
-        # Cadastro sem curso (fallback para compatibilidade)
-        # Verifica se email já existe globalmente
-        if db.query(User).filter(User.email == user_data.email).first():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email já cadastrado"
-            )
-
-        # Verifica se matrícula já existe globalmente
-        if db.query(User).filter(User.matricula == user_data.matricula).first():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Matrícula já cadastrada"
-            )
+    # Sem curso_id (fallback para compatibilidade) a verificação é global
+    verificar_email_matricula_disponiveis(
+        db, user_data.email, user_data.matricula, user_data.curso_id
+    )
 
-    new_user = User(
+    return inserir_usuario(
+        db,
         nome=user_data.nome,
         email=user_data.email,
         matricula=user_data.matricula,
@@ -309,18 +335,12 @@ async def signup(
         curso_id=user_data.curso_id
     )
 
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-
-    return UserResponse.model_validate(new_user)
-
 
 @router.delete("/users/{user_id}")
-async def delete_user(
+def delete_user(
     user_id: int,
     db: Session = Depends(get_db),
-    current_admin: User = Depends(get_current_admin)
+    current_admin: CurrentUser = Depends(get_current_admin)
 ):
     """Apagar usuário (apenas admin)"""
     user = db.query(User).filter(User.id == user_id).first()
@@ -349,8 +369,10 @@ async def delete_user(
     # Apaga registros de ponto do usuário
     db.query(TimeRecord).filter(TimeRecord.user_id == user_id).delete()
 
-    # Apaga usuário
-    db.delete(user)
+    # Apaga usuário (DELETE direto: db.delete carregaria user.registros só para desvinculá-los)
+    nome = user.nome
+    db.query(User).filter(User.id == user_id).delete(synchronize_session=False)
     db.commit()
+    invalidar_usuario(user_id)
 
-    return {"message": f"Usuário {user.nome} apagado com sucesso"}
+    return {"message": f"Usuário {nome} apagado com sucesso"}
@@ -1,16 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy import func, insert, select
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Iterable, NamedTuple, Optional, List
 from datetime import datetime, date, timedelta
 import os
 import uuid
+import numpy as np
 from app.database import get_db
 from app.models.models import User, TimeRecord, CompanySettings, Location
-from app.utils.auth import get_current_user
-from app.utils.geo import is_within_radius
-from app.utils.face import detect_face
+from app.utils.auth import get_current_user, CurrentUser
+from app.utils.geo import is_within_radius, calculate_distance_batch
+from app.utils.face import detect_face_in_pool
+from app.utils.cache import TTLCache
+from app.utils.periodo import limites_periodo
 from config import UPLOAD_FOLDER, DEFAULT_COMPANY_LATITUDE, DEFAULT_COMPANY_LONGITUDE, DEFAULT_ALLOWED_RADIUS_METERS
 
 router = APIRouter(prefix="/ponto", tags=["Ponto"])
@@ -53,6 +57,41 @@ class StatusPontoResponse(BaseModel):
     horas_hoje: str
 
 
+# Tamanho dos blocos lidos do upload da foto
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+# Colunas de RegistroPontoResponse lidas direto do banco (sem hidratar TimeRecord)
+_COLUNAS_REGISTRO = (
+    TimeRecord.id,
+    TimeRecord.tipo,
+    TimeRecord.timestamp,
+    TimeRecord.latitude,
+    TimeRecord.longitude,
+    TimeRecord.dentro_raio,
+    TimeRecord.observacao,
+    TimeRecord.face_detected,
+    TimeRecord.face_count,
+    TimeRecord.location_id,
+)
+
+
+# Configuração da empresa e locais ativos mudam raramente: ficam em cache por processo.
+# As rotas de admin chamam invalidar_cache_locais() ao alterá-los.
+_empresa_cache = TTLCache(ttl=60, maxsize=1)
+_locais_cache = TTLCache(ttl=60)
+
+
+def invalidar_cache_locais():
+    _empresa_cache.clear()
+    _locais_cache.clear()
+
+
+def _registro_dict(row) -> dict:
+    """Linha de _COLUNAS_REGISTRO no formato de RegistroPontoResponse."""
+    return {**row._mapping, "distancia_metros": None, "location_name": None}
+
+
 def get_company_settings(db: Session) -> CompanySettings:
     settings = db.query(CompanySettings).first()
     if not settings:
@@ -67,62 +106,80 @@ def get_company_settings(db: Session) -> CompanySettings:
     return settings
 
 
+def get_company_area(db: Session):
+    """Retorna (latitude, longitude, raio_permitido_metros) da empresa, com cache."""
+    area = _empresa_cache.get("area")
+    if area is None:
+        settings = get_company_settings(db)
+        area = (settings.latitude, settings.longitude, settings.raio_permitido_metros)
+        _empresa_cache.set("area", area)
+    return area
+
+
+class LocaisAtivos(NamedTuple):
+    """Locais ativos em arrays, prontos para o cálculo vetorizado de distância."""
+    ids: List[int]
+    nomes: List[str]
+    latitudes: np.ndarray
+    longitudes: np.ndarray
+    raios: np.ndarray       # metros
+
+
+def get_active_locations(db: Session, curso_id: int = None) -> LocaisAtivos:
+    """Locais ativos (do curso, se informado), com cache."""
+    locais = _locais_cache.get(curso_id)
+    if locais is None:
+        query = db.query(
+            Location.id, Location.nome, Location.latitude, Location.longitude, Location.raio_metros
+        ).filter(Location.ativo == True)
+        if curso_id:
+            query = query.filter(Location.curso_id == curso_id)
+        rows = query.all()
+        locais = LocaisAtivos(
+            ids=[r.id for r in rows],
+            nomes=[r.nome for r in rows],
+            latitudes=np.array([r.latitude for r in rows], dtype=float),
+            longitudes=np.array([r.longitude for r in rows], dtype=float),
+            raios=np.array([r.raio_metros for r in rows], dtype=float)
+        )
+        _locais_cache.set(curso_id, locais)
+    return locais
+
+
 def check_all_locations(db: Session, user_lat: float, user_lon: float, curso_id: int = None):
     """
     Verifica se o usuário está dentro do raio de algum local cadastrado.
     Se curso_id especificado, filtra apenas locais do curso.
     Retorna: (dentro_raio, distancia, location_id, location_name)
     """
-    query = db.query(Location).filter(Location.ativo == True)
-    if curso_id:
-        query = query.filter(Location.curso_id == curso_id)
-    locations = query.all()
+    locais = get_active_locations(db, curso_id)
 
-    if not locations:
+    if not locais.ids:
         # Se não há locais cadastrados, usa as configurações da empresa
-        settings = get_company_settings(db)
+        empresa_lat, empresa_lon, raio = get_company_area(db)
         dentro_raio, distancia = is_within_radius(
-            user_lat, user_lon,
-            settings.latitude, settings.longitude,
-            settings.raio_permitido_metros
+            user_lat, user_lon, empresa_lat, empresa_lon, raio
         )
         return dentro_raio, distancia, None, None
 
-    # Verifica cada local e retorna o mais próximo que está dentro do raio
-    melhor_match = None
-    menor_distancia = float('inf')
+    distancias = calculate_distance_batch(user_lat, user_lon, locais.latitudes, locais.longitudes)
+    dentro = distancias <= locais.raios
 
-    for loc in locations:
-        dentro, dist = is_within_radius(
-            user_lat, user_lon,
-            loc.latitude, loc.longitude,
-            loc.raio_metros
-        )
-        if dentro and dist < menor_distancia:
-            melhor_match = loc
-            menor_distancia = dist
-
-    if melhor_match:
-        return True, menor_distancia, melhor_match.id, melhor_match.nome
-
-    # Se não está em nenhum local, retorna o mais próximo
-    for loc in locations:
-        _, dist = is_within_radius(
-            user_lat, user_lon,
-            loc.latitude, loc.longitude,
-            loc.raio_metros
-        )
-        if dist < menor_distancia:
-            menor_distancia = dist
+    # Retorna o local mais próximo que está dentro do raio
+    if dentro.any():
+        i = int(np.argmin(np.where(dentro, distancias, np.inf)))
+        return True, float(distancias[i]), locais.ids[i], locais.nomes[i]
 
-    return False, menor_distancia, None, None
+    # Se não está em nenhum local, retorna a distância do mais próximo
+    return False, float(distancias.min()), None, None
 
 
-def calcular_horas_trabalhadas(registros: List[TimeRecord]) -> timedelta:
+def calcular_horas_trabalhadas(registros: Iterable[TimeRecord]) -> timedelta:
+    """Soma os intervalos entrada -> saída. Espera registros já ordenados por timestamp (ORDER BY no SQL)."""
     total = timedelta()
     entrada = None
 
-    for reg in sorted(registros, key=lambda x: x.timestamp):
+    for reg in registros:
         if reg.tipo == 'entrada':
             entrada = reg.timestamp
         elif reg.tipo == 'saida' and entrada:
@@ -139,27 +196,33 @@ def formatar_horas(td: timedelta) -> str:
     return f"{hours:02d}:{minutes:02d}"
 
 
-@router.get("/status", response_model=StatusPontoResponse)
-async def get_status_ponto(
+@router.get(
+    "/status",
+    response_model=None,
+    response_class=ORJSONResponse,
+    responses={200: {"model": StatusPontoResponse}}
+)
+def get_status_ponto(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     hoje = date.today()
-    inicio_dia = datetime.combine(hoje, datetime.min.time())
-    fim_dia = datetime.combine(hoje, datetime.max.time())
+    inicio_dia, fim_dia = limites_periodo(hoje, hoje)
 
-    registros_hoje = db.query(TimeRecord).filter(
-        and_(
+    # Uma consulta em ordem cronológica serve a lista, o último registro e o total de horas
+    registros_hoje = db.execute(
+        select(*_COLUNAS_REGISTRO).where(
             TimeRecord.user_id == current_user.id,
             TimeRecord.timestamp >= inicio_dia,
             TimeRecord.timestamp <= fim_dia
-        )
-    ).order_by(TimeRecord.timestamp.desc()).all()
+        ).order_by(TimeRecord.timestamp.asc())
+    ).all()
 
-    ultimo_registro = registros_hoje[0] if registros_hoje else None
+    registros = [_registro_dict(r) for r in registros_hoje]
+    ultimo_registro = registros[-1] if registros else None
 
     # Determina próximo tipo de registro
-    if not ultimo_registro or ultimo_registro.tipo == 'saida':
+    if not ultimo_registro or ultimo_registro["tipo"] == 'saida':
         pode_bater = 'entrada'
     else:
         pode_bater = 'saida'
@@ -167,22 +230,22 @@ async def get_status_ponto(
     # Calcula horas trabalhadas hoje
     horas_hoje = calcular_horas_trabalhadas(registros_hoje)
 
-    return StatusPontoResponse(
-        pode_bater=pode_bater,
-        ultimo_registro=RegistroPontoResponse.model_validate(ultimo_registro) if ultimo_registro else None,
-        registros_hoje=[RegistroPontoResponse.model_validate(r) for r in reversed(registros_hoje)],
-        horas_hoje=formatar_horas(horas_hoje)
-    )
+    return ORJSONResponse({
+        "pode_bater": pode_bater,
+        "ultimo_registro": ultimo_registro,
+        "registros_hoje": registros,
+        "horas_hoje": formatar_horas(horas_hoje)
+    })
 
 
 @router.post("/registrar", response_model=RegistroPontoResponse)
-async def registrar_ponto(
+def registrar_ponto(
     latitude: Optional[float] = Form(None),
     longitude: Optional[float] = Form(None),
     observacao: Optional[str] = Form(None),
     foto: Optional[UploadFile] = File(None),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     # VALIDAÇÃO: Geolocalização é obrigatória
     if latitude is None or longitude is None:
@@ -191,12 +254,15 @@ async def registrar_ponto(
             detail="Geolocalização é obrigatória. Permita o acesso ao GPS."
         )
 
-    # Verifica último registro para determinar tipo
-    ultimo_registro = db.query(TimeRecord).filter(
-        TimeRecord.user_id == current_user.id
-    ).order_by(TimeRecord.timestamp.desc()).first()
+    # Verifica o tipo do último registro para determinar o próximo (só a coluna, sem carregar a linha)
+    ultimo_tipo = db.execute(
+        select(TimeRecord.tipo)
+        .where(TimeRecord.user_id == current_user.id)
+        .order_by(TimeRecord.timestamp.desc())
+        .limit(1)
+    ).scalar_one_or_none()
 
-    if not ultimo_registro or ultimo_registro.tipo == 'saida':
+    if ultimo_tipo in (None, 'saida'):
         tipo = 'entrada'
     else:
         tipo = 'saida'
@@ -216,21 +282,22 @@ async def registrar_ponto(
         filename = f"{current_user.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}{ext}"
         filepath = os.path.join(UPLOAD_FOLDER, filename)
 
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        content = await foto.read()
-
+        # Copia em blocos para o disco; o buffer acumula os mesmos blocos para a detecção facial
+        content = bytearray()
         with open(filepath, "wb") as f:
-            f.write(content)
+            while chunk := foto.file.read(UPLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                content += chunk
 
         foto_path = filepath
 
         # Detecta rosto na foto
-        face_result = detect_face(content)
+        face_result = detect_face_in_pool(content)
         face_detected = face_result["face_detected"]
         face_count = face_result["face_count"]
 
     # Cria registro
-    novo_registro = TimeRecord(
+    valores = dict(
         user_id=current_user.id,
         tipo=tipo,
         latitude=latitude,
@@ -243,9 +310,17 @@ async def registrar_ponto(
         location_id=location_id
     )
 
-    db.add(novo_registro)
-    db.commit()
-    db.refresh(novo_registro)
+    if db.get_bind().dialect.insert_returning:
+        # INSERT ... RETURNING devolve o registro gravado sem o SELECT do refresh
+        novo_registro = db.execute(
+            insert(TimeRecord).values(**valores).returning(*_COLUNAS_REGISTRO)
+        ).one()
+        db.commit()
+    else:
+        novo_registro = TimeRecord(**valores)
+        db.add(novo_registro)
+        db.commit()
+        db.refresh(novo_registro)
 
     response = RegistroPontoResponse.model_validate(novo_registro)
     response.distancia_metros = distancia
@@ -254,37 +329,42 @@ async def registrar_ponto(
     return response
 
 
-@router.get("/historico", response_model=HistoricoResponse)
-async def get_historico(
+@router.get(
+    "/historico",
+    response_model=None,
+    response_class=ORJSONResponse,
+    responses={200: {"model": HistoricoResponse}}
+)
+def get_historico(
     data_inicio: Optional[date] = None,
     data_fim: Optional[date] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     if not data_inicio:
         data_inicio = date.today().replace(day=1)
     if not data_fim:
         data_fim = date.today()
 
-    inicio = datetime.combine(data_inicio, datetime.min.time())
-    fim = datetime.combine(data_fim, datetime.max.time())
+    inicio, fim = limites_periodo(data_inicio, data_fim)
 
-    registros = db.query(TimeRecord).filter(
-        and_(
+    registros = db.execute(
+        select(*_COLUNAS_REGISTRO).where(
             TimeRecord.user_id == current_user.id,
             TimeRecord.timestamp >= inicio,
             TimeRecord.timestamp <= fim
-        )
-    ).order_by(TimeRecord.timestamp.asc()).all()
+        ).order_by(TimeRecord.timestamp.asc())
+    ).all()
 
     # Calcula total de horas
     total_horas = calcular_horas_trabalhadas(registros)
 
     # Conta dias únicos trabalhados
-    dias_unicos = set(r.timestamp.date() for r in registros)
-
-    return HistoricoResponse(
-        registros=[RegistroPontoResponse.model_validate(r) for r in registros],
-        total_horas_periodo=formatar_horas(total_horas),
-        dias_trabalhados=len(dias_unicos)
-    )
+    dias_unicos = set(r.timestamp.toordinal() for r in registros)
+
+    # Dados vêm direto do banco: serializa com orjson sem revalidar cada registro no Pydantic
+    return ORJSONResponse({
+        "registros": [_registro_dict(r) for r in registros],
+        "total_horas_periodo": formatar_horas(total_horas),
+        "dias_trabalhados": len(dias_unicos)
+    })
@@ -1,12 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import case, func, select
+from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional
 from datetime import datetime
 
 from app.database import get_db
 from app.models.models import User, Curso, Location, TimeRecord
-from app.utils.auth import get_current_super_admin, get_password_hash
+from app.utils.auth import CurrentUser, get_current_super_admin, get_password_hash, invalidar_cursos
+from app.utils.cache import TTLCache
+from app.routes.ponto import invalidar_cache_locais
 
 router = APIRouter(prefix="/api/super-admin", tags=["Super Admin"])
 
@@ -67,22 +71,71 @@ class CursoStats(BaseModel):
     total_registros: int
 
 
+# As listagens abaixo montam as respostas com model_construct (dados vindos do
+# banco, sem revalidação por item) e usam response_model=None para o FastAPI
+# não validar a lista inteira de novo; os schemas ficam documentados em `responses`.
+
+# ============= CONTAGENS POR CURSO =============
+# Subconsultas agrupadas por curso_id, juntadas a Curso em uma única consulta
+# (em vez de um COUNT por curso)
+
+def _usuarios_por_curso():
+    return select(
+        User.curso_id,
+        func.count(User.id).label("total_usuarios"),
+        func.sum(case((User.is_admin == False, 1), else_=0)).label("total_alunos"),
+        func.sum(case((User.is_admin == True, 1), else_=0)).label("total_admins")
+    ).group_by(User.curso_id).subquery()
+
+
+def _registros_por_curso():
+    return select(
+        User.curso_id,
+        func.count(TimeRecord.id).label("total_registros")
+    ).join(TimeRecord, TimeRecord.user_id == User.id).group_by(User.curso_id).subquery()
+
+
+def _locais_por_curso():
+    return select(
+        Location.curso_id,
+        func.count(Location.id).label("total_locais")
+    ).group_by(Location.curso_id).subquery()
+
+
+# O painel consulta as estatísticas repetidamente; o resultado fica em cache por pouco
+# tempo e é descartado quando o super admin altera cursos ou cria admins. Registros e
+# alunos novos aparecem após o TTL.
+_stats_cache = TTLCache(ttl=60, maxsize=1)
+
+
+def invalidar_stats() -> None:
+    _stats_cache.clear()
+
+
 # ============= ROTAS DE CURSOS =============
 
-@router.get("/cursos", response_model=List[CursoResponse])
-async def list_cursos(
+@router.get("/cursos", response_model=None, responses={200: {"model": List[CursoResponse]}})
+def list_cursos(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_super_admin)
+    current_user: CurrentUser = Depends(get_current_super_admin)
 ):
     """Lista todos os cursos."""
-    cursos = db.query(Curso).order_by(Curso.nome).all()
+    usuarios = _usuarios_por_curso()
+    locais = _locais_por_curso()
+
+    rows = db.query(
+        Curso,
+        func.coalesce(usuarios.c.total_usuarios, 0),
+        func.coalesce(locais.c.total_locais, 0)
+    ).outerjoin(
+        usuarios, usuarios.c.curso_id == Curso.id
+    ).outerjoin(
+        locais, locais.c.curso_id == Curso.id
+    ).order_by(Curso.nome).all()
 
     result = []
-    for curso in cursos:
-        total_alunos = db.query(User).filter(User.curso_id == curso.id).count()
-        total_locais = db.query(Location).filter(Location.curso_id == curso.id).count()
-
-        curso_data = CursoResponse(
+    for curso, total_alunos, total_locais in rows:
+        curso_data = CursoResponse.model_construct(
             id=curso.id,
             nome=curso.nome,
             slug=curso.slug,
@@ -97,27 +150,28 @@ async def list_cursos(
 
 
 @router.post("/cursos", response_model=CursoResponse)
-async def create_curso(
+def create_curso(
     curso_data: CursoCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_super_admin)
+    current_user: CurrentUser = Depends(get_current_super_admin)
 ):
     """Cria um novo curso."""
-    # Verifica se slug já existe
-    existing = db.query(Curso).filter(Curso.slug == curso_data.slug.lower()).first()
-    if existing:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Já existe um curso com este slug"
-        )
-
     curso = Curso(
         nome=curso_data.nome,
         slug=curso_data.slug.lower()
     )
     db.add(curso)
-    db.commit()
+    # A unicidade do slug é garantida pelo banco; evita um SELECT prévio e a corrida entre ele e o INSERT
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Já existe um curso com este slug"
+        )
     db.refresh(curso)
+    invalidar_stats()
 
     return CursoResponse(
         id=curso.id,
@@ -131,11 +185,11 @@ async def create_curso(
 
 
 @router.put("/cursos/{curso_id}", response_model=CursoResponse)
-async def update_curso(
+def update_curso(
     curso_id: int,
     curso_data: CursoUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_super_admin)
+    current_user: CurrentUser = Depends(get_current_super_admin)
 ):
     """Atualiza um curso existente."""
     curso = db.query(Curso).filter(Curso.id == curso_id).first()
@@ -164,6 +218,8 @@ async def update_curso(
 
     db.commit()
     db.refresh(curso)
+    invalidar_cursos()
+    invalidar_stats()
 
     total_alunos = db.query(User).filter(User.curso_id == curso.id).count()
     total_locais = db.query(Location).filter(Location.curso_id == curso.id).count()
@@ -180,10 +236,10 @@ async def update_curso(
 
 
 @router.delete("/cursos/{curso_id}")
-async def delete_curso(
+def delete_curso(
     curso_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_super_admin)
+    current_user: CurrentUser = Depends(get_current_super_admin)
 ):
     """Remove um curso (apenas se não tiver usuários)."""
     curso = db.query(Curso).filter(Curso.id == curso_id).first()
@@ -206,30 +262,32 @@ async def delete_curso(
 
     db.delete(curso)
     db.commit()
+    invalidar_cache_locais()
+    invalidar_cursos()
+    invalidar_stats()
 
     return {"message": "Curso removido com sucesso"}
 
 
 # ============= ROTAS DE ADMINS =============
 
-@router.get("/admins", response_model=List[AdminResponse])
-async def list_admins(
+@router.get("/admins", response_model=None, responses={200: {"model": List[AdminResponse]}})
+def list_admins(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_super_admin)
+    current_user: CurrentUser = Depends(get_current_super_admin)
 ):
     """Lista todos os administradores de todos os cursos."""
-    admins = db.query(User).filter(
+    # O curso de cada admin vem no mesmo SELECT (JOIN), sem uma consulta por admin.
+    # O filtro é idêntico à condição do índice parcial ix_users_staff, para que o banco o use
+    admins = db.query(User).options(joinedload(User.curso)).filter(
         (User.is_admin == True) | (User.is_super_admin == True)
     ).order_by(User.nome).all()
 
     result = []
     for admin in admins:
-        curso_nome = None
-        if admin.curso_id:
-            curso = db.query(Curso).filter(Curso.id == admin.curso_id).first()
-            curso_nome = curso.nome if curso else None
+        curso_nome = admin.curso.nome if admin.curso else None
 
-        result.append(AdminResponse(
+        result.append(AdminResponse.model_construct(
             id=admin.id,
             nome=admin.nome,
             email=admin.email,
@@ -243,31 +301,20 @@ async def list_admins(
 
 
 @router.post("/admins", response_model=AdminResponse)
-async def create_admin(
+def create_admin(
     admin_data: AdminCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_super_admin)
+    current_user: CurrentUser = Depends(get_current_super_admin)
 ):
     """Cria um administrador para um curso."""
-    # Verifica se curso existe
-    curso = db.query(Curso).filter(Curso.id == admin_data.curso_id).first()
-    if not curso:
+    # Verifica se curso existe (o nome também é usado na resposta)
+    curso_nome = db.query(Curso.nome).filter(Curso.id == admin_data.curso_id).scalar()
+    if curso_nome is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Curso não encontrado"
         )
 
-    # Verifica se email já existe no curso
-    existing = db.query(User).filter(
-        User.email == admin_data.email,
-        User.curso_id == admin_data.curso_id
-    ).first()
-    if existing:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Já existe um usuário com este email neste curso"
-        )
-
     admin = User(
         nome=admin_data.nome,
         email=admin_data.email,
@@ -277,59 +324,72 @@ async def create_admin(
         curso_id=admin_data.curso_id
     )
     db.add(admin)
-    db.commit()
-    db.refresh(admin)
+    # Email e matrícula são únicos por curso (uq_user_email_curso / uq_user_matricula_curso);
+    # a constraint é a única verificação livre de corrida, então não há SELECT prévio
+    try:
+        db.flush()
+        admin_id = admin.id
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Já existe um usuário com este email ou matrícula neste curso"
+        )
+    invalidar_stats()
 
     return AdminResponse(
-        id=admin.id,
-        nome=admin.nome,
-        email=admin.email,
-        matricula=admin.matricula,
-        is_admin=admin.is_admin,
-        curso_id=admin.curso_id,
-        curso_nome=curso.nome
+        id=admin_id,
+        nome=admin_data.nome,
+        email=admin_data.email,
+        matricula=admin_data.matricula,
+        is_admin=True,
+        curso_id=admin_data.curso_id,
+        curso_nome=curso_nome
     )
 
 
 # ============= ESTATÍSTICAS =============
 
-@router.get("/stats", response_model=List[CursoStats])
-async def get_stats(
+@router.get("/stats", response_model=None, responses={200: {"model": List[CursoStats]}})
+def get_stats(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_super_admin)
+    current_user: CurrentUser = Depends(get_current_super_admin)
 ):
     """Retorna estatísticas de todos os cursos."""
-    cursos = db.query(Curso).all()
+    stats = _stats_cache.get("stats")
+    if stats is not None:
+        return stats
+
+    usuarios = _usuarios_por_curso()
+    locais = _locais_por_curso()
+    registros = _registros_por_curso()
+
+    rows = db.query(
+        Curso.id,
+        Curso.nome,
+        func.coalesce(usuarios.c.total_alunos, 0),
+        func.coalesce(usuarios.c.total_admins, 0),
+        func.coalesce(locais.c.total_locais, 0),
+        func.coalesce(registros.c.total_registros, 0)
+    ).outerjoin(
+        usuarios, usuarios.c.curso_id == Curso.id
+    ).outerjoin(
+        locais, locais.c.curso_id == Curso.id
+    ).outerjoin(
+        registros, registros.c.curso_id == Curso.id
+    ).all()
 
     stats = []
-    for curso in cursos:
-        total_alunos = db.query(User).filter(
-            User.curso_id == curso.id,
-            User.is_admin == False
-        ).count()
-
-        total_admins = db.query(User).filter(
-            User.curso_id == curso.id,
-            User.is_admin == True
-        ).count()
-
-        total_locais = db.query(Location).filter(
-            Location.curso_id == curso.id
-        ).count()
-
-        # Registros dos usuários do curso
-        user_ids = db.query(User.id).filter(User.curso_id == curso.id).subquery()
-        total_registros = db.query(TimeRecord).filter(
-            TimeRecord.user_id.in_(user_ids)
-        ).count()
-
-        stats.append(CursoStats(
-            curso_id=curso.id,
-            curso_nome=curso.nome,
+    for curso_id, curso_nome, total_alunos, total_admins, total_locais, total_registros in rows:
+        stats.append(CursoStats.model_construct(
+            curso_id=curso_id,
+            curso_nome=curso_nome,
             total_alunos=total_alunos,
             total_admins=total_admins,
             total_locais=total_locais,
             total_registros=total_registros
         ))
 
+    _stats_cache.set("stats", stats)
     return stats
@@ -1,2 +1,4 @@
 from .auth import get_password_hash, verify_password, create_access_token, get_current_user
-from .geo import calculate_distance, is_within_radius
+from .geo import calculate_distance, calculate_distance_batch, is_within_radius
+from .cache import TTLCache
+from .periodo import limites_periodo
@@ -1,20 +1,38 @@
+from dataclasses import dataclass, fields
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
+from typing import NamedTuple, Optional
+import jwt
+from jwt import InvalidTokenError
 import bcrypt
 from fastapi import Depends, HTTPException, status, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 import sys
 sys.path.append('../..')
 from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
-from app.database import get_db
+from app.database import get_db, SessionLocal
 from app.models.models import User, Curso
+from app.utils.cache import TTLCache
 
 security = HTTPBearer(auto_error=False)
 
+# Chave já em bytes (evita codificar a string a cada token) e claims obrigatórios
+_SECRET_KEY_BYTES = SECRET_KEY.encode('utf-8')
+_JWT_DECODE_OPTIONS = {"require": ["exp", "sub"]}
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+
+# Hash de referência para quando o usuário não existe: o bcrypt roda do mesmo jeito,
+# então o tempo de resposta do login não revela se o email está cadastrado. É fixo
+# (mesmo custo, 12, dos hashes gerados por get_password_hash) para não gastar um
+# bcrypt a cada processo iniciado.
+_DUMMY_HASH = '$2b$12$Qb6wVcX53ykiY6kM0ogBsejsE85HAXME85Zz8xWsBICWdQRfuaMeK'
+
+
+def verify_password(plain_password: str, hashed_password: Optional[str]) -> bool:
+    if hashed_password is None:
+        bcrypt.checkpw(plain_password.encode('utf-8'), _DUMMY_HASH.encode('utf-8'))
+        return False
     return bcrypt.checkpw(
         plain_password.encode('utf-8'),
         hashed_password.encode('utf-8')
@@ -35,7 +53,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, _SECRET_KEY_BYTES, algorithm=ALGORITHM)
     return encoded_jwt
 
 
@@ -47,11 +65,41 @@ def get_token_from_request(request: Request) -> Optional[str]:
     return token
 
 
+@dataclass(frozen=True)
+class CurrentUser:
+    """Dados do usuário autenticado usados pelas rotas (snapshot, fora da sessão)."""
+    id: int
+    nome: str
+    email: str
+    matricula: str
+    is_admin: bool
+    is_super_admin: bool
+    ativo: bool
+    curso_id: Optional[int]
+
+
+_COLUNAS_USUARIO_ATUAL = tuple(getattr(User, f.name) for f in fields(CurrentUser))
+
+# Evita um SELECT em users a cada requisição autenticada. Rotas que desativam
+# ou apagam usuários chamam invalidar_usuario(); o TTL limita o atraso nos
+# outros processos.
+_usuarios_cache = TTLCache(ttl=60, maxsize=10000)
+
+
+def invalidar_usuario(user_id: int) -> None:
+    _usuarios_cache.pop(user_id)
+
+
+def _buscar_usuario_no_banco(user_id: int) -> Optional[CurrentUser]:
+    with SessionLocal() as db:
+        row = db.query(*_COLUNAS_USUARIO_ATUAL).filter(User.id == user_id).first()
+    return CurrentUser(**row._mapping) if row is not None else None
+
+
 async def get_current_user(
     request: Request,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> CurrentUser:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Credenciais inválidas",
@@ -68,17 +116,22 @@ async def get_current_user(
         raise credentials_exception
 
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, _SECRET_KEY_BYTES, algorithms=[ALGORITHM], options=_JWT_DECODE_OPTIONS)
         user_id_str = payload.get("sub")
         if user_id_str is None:
             raise credentials_exception
         user_id = int(user_id_str)
-    except (JWTError, ValueError):
+    except (InvalidTokenError, ValueError):
         raise credentials_exception
 
-    user = db.query(User).filter(User.id == user_id).first()
+    # Sessão do banco só no cache miss; a consulta síncrona vai para o threadpool
+    user = _usuarios_cache.get(user_id)
     if user is None:
-        raise credentials_exception
+        user = await run_in_threadpool(_buscar_usuario_no_banco, user_id)
+        if user is None:
+            raise credentials_exception
+        _usuarios_cache.set(user_id, user)
+
     if not user.ativo:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -87,7 +140,7 @@ async def get_current_user(
     return user
 
 
-async def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_admin(current_user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
     if not current_user.is_admin and not current_user.is_super_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -96,7 +149,7 @@ async def get_current_admin(current_user: User = Depends(get_current_user)) -> U
     return current_user
 
 
-async def get_current_super_admin(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_super_admin(current_user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
     """Verifica se o usuário é super admin (gerencia todos os cursos)."""
     if not current_user.is_super_admin:
         raise HTTPException(
@@ -106,19 +159,72 @@ async def get_current_super_admin(current_user: User = Depends(get_current_user)
     return current_user
 
 
-def get_curso_from_path(request: Request, db: Session = Depends(get_db)) -> Optional[Curso]:
+class CursoAtivo(NamedTuple):
+    """Dados de um curso ativo, guardados em cache por slug."""
+    id: int
+    nome: str
+    slug: str
+
+
+# Cursos mudam raramente; as rotas de super admin chamam invalidar_cursos() ao alterá-los
+_cursos_cache = TTLCache(ttl=120, maxsize=1024)
+
+
+def invalidar_cursos() -> None:
+    _cursos_cache.clear()
+
+
+def carregar_cursos_ativos(db: Session) -> int:
+    """
+    Preenche o cache com todos os cursos ativos em uma consulta (na inicialização).
+
+    Assim as primeiras requisições de cada curso já não vão ao banco.
+
+    Returns:
+        Quantidade de cursos carregados
+    """
+    rows = db.query(Curso.id, Curso.nome, Curso.slug).filter(Curso.ativo == True).all()
+    for row in rows:
+        _cursos_cache.set(row.slug, CursoAtivo(*row))
+    return len(rows)
+
+
+def curso_em_cache(curso_slug: str) -> Optional[CursoAtivo]:
+    """Curso ativo já em cache, sem consultar o banco (None se não estiver)."""
+    return _cursos_cache.get(curso_slug)
+
+
+def buscar_curso_ativo(db: Session, curso_slug: str) -> Optional[CursoAtivo]:
+    """Busca um curso ativo pelo slug, com cache (slugs inexistentes não são guardados)."""
+    curso = _cursos_cache.get(curso_slug)
+    if curso is None:
+        row = db.query(Curso.id, Curso.nome, Curso.slug).filter(
+            Curso.slug == curso_slug,
+            Curso.ativo == True
+        ).first()
+        if row is None:
+            return None
+        curso = CursoAtivo(*row)
+        _cursos_cache.set(curso_slug, curso)
+    return curso
+
+
+# Primeiro segmento de paths que não são de curso (static, api, super-admin, etc.)
+_PATHS_RESERVADOS = frozenset({
+    'static', 'uploads', 'api', 'super-admin', 'docs', 'redoc', 'openapi.json',
+    'favicon.ico', 'robots.txt', 'health', 'healthz',
+})
+
+
+def get_curso_from_path(request: Request, db: Session = Depends(get_db)) -> Optional[CursoAtivo]:
     """Extrai o curso do path da URL (ex: /medicina/dashboard -> curso 'medicina')."""
-    path_parts = request.url.path.strip('/').split('/')
-    if path_parts:
-        curso_slug = path_parts[0]
-        # Ignora paths que não são de curso (static, api, super-admin, etc.)
-        if curso_slug not in ['static', 'uploads', 'api', 'super-admin', 'docs', 'openapi.json']:
-            curso = db.query(Curso).filter(Curso.slug == curso_slug, Curso.ativo == True).first()
-            return curso
-    return None
+    curso_slug = request.url.path.lstrip('/').partition('/')[0]
+    if not curso_slug or curso_slug in _PATHS_RESERVADOS:
+        return None
+    return buscar_curso_ativo(db, curso_slug)
 
 
-async def get_required_curso(request: Request, db: Session = Depends(get_db)) -> Curso:
+def get_required_curso(request: Request, db: Session = Depends(get_db)) -> CursoAtivo:
     """Exige que um curso válido esteja no path."""
     curso = get_curso_from_path(request, db)
     if not curso:
@@ -130,9 +236,9 @@ async def get_required_curso(request: Request, db: Session = Depends(get_db)) ->
 
 
 async def validate_user_curso_access(
-    current_user: User = Depends(get_current_user),
-    curso: Curso = Depends(get_required_curso)
-) -> User:
+    current_user: CurrentUser = Depends(get_current_user),
+    curso: CursoAtivo = Depends(get_required_curso)
+) -> CurrentUser:
     """Valida que o usuário tem acesso ao curso na URL."""
     # Super admin tem acesso a todos os cursos
     if current_user.is_super_admin:
@@ -161,12 +267,12 @@ def get_optional_user(
         return None
 
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, _SECRET_KEY_BYTES, algorithms=[ALGORITHM], options=_JWT_DECODE_OPTIONS)
         user_id_str = payload.get("sub")
         if user_id_str is None:
             return None
         user_id = int(user_id_str)
         user = db.query(User).filter(User.id == user_id).first()
         return user if user and user.ativo else None
-    except (JWTError, ValueError):
+    except (InvalidTokenError, ValueError):
         return None
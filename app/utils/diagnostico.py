@@ -0,0 +1,32 @@
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class LazyLoadError(RuntimeError):
+    """Relacionamento carregado sob demanda com a detecção em modo 'raise'."""
+
+
+def ativar_deteccao_lazy_load(raise_: bool = False) -> None:
+    """
+    Avisa (ou falha) sempre que um relacionamento é carregado sob demanda (lazy load).
+
+    Dentro de um loop isso vira N+1 consultas; em desenvolvimento/CI o aviso mostra
+    onde falta um joinedload/selectinload. Não deve ser ativado em produção.
+
+    Args:
+        raise_: Se True, levanta LazyLoadError em vez de apenas registrar o aviso
+    """
+    @event.listens_for(Session, "do_orm_execute")
+    def _verificar_lazy_load(orm_execute_state):
+        # lazy_loaded_from só é preenchido em lazy loads (não em selectinload/subqueryload)
+        if not orm_execute_state.is_select or orm_execute_state.lazy_loaded_from is None:
+            return
+        relacionamento = orm_execute_state.loader_strategy_path[-1]
+        mensagem = f"Possível N+1: lazy load de {relacionamento}"
+        if raise_:
+            raise LazyLoadError(mensagem)
+        logger.warning(mensagem)
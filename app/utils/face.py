@@ -1,6 +1,61 @@
 import cv2
 import numpy as np
-from typing import Dict
+import multiprocessing
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+from config import FACE_DETECTION_WORKERS
+
+# Menor lado (px) da imagem reduzida para ainda valer a pena detectar nela
+LADO_MINIMO_DETECCAO = 320
+
+# Menor rosto detectado, em pixels da imagem original
+TAMANHO_MINIMO_ROSTO = 30
+
+# Marcadores SOF do JPEG (C4, C8 e CC não são SOF) onde ficam as dimensões
+_MARCADORES_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# O classificador é carregado uma vez por thread (o XML tem ~1 MB e o
+# detectMultiScale não é thread-safe); nos workers do pool há uma thread só
+_local = threading.local()
+
+
+def _get_face_cascade() -> cv2.CascadeClassifier:
+    cascade = getattr(_local, "face_cascade", None)
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        )
+        _local.face_cascade = cascade
+    return cascade
+
+
+def _dimensoes_imagem(image_bytes: bytes) -> Optional[Tuple[int, int]]:
+    """Lê (altura, largura) do cabeçalho de um JPEG ou PNG sem decodificar a imagem."""
+    if image_bytes[:8] == b'\x89PNG\r\n\x1a\n' and len(image_bytes) >= 24:
+        largura, altura = struct.unpack('>II', image_bytes[16:24])
+        return altura, largura
+
+    if image_bytes[:2] != b'\xff\xd8':
+        return None
+    i = 2
+    while i + 9 <= len(image_bytes):
+        if image_bytes[i] != 0xFF:
+            return None
+        marcador = image_bytes[i + 1]
+        if marcador == 0xFF:
+            # Byte de preenchimento entre segmentos
+            i += 1
+            continue
+        if marcador in _MARCADORES_SOF:
+            return struct.unpack('>HH', image_bytes[i + 5:i + 9])
+        i += 2 + struct.unpack('>H', image_bytes[i + 2:i + 4])[0]
+    return None
 
 
 def detect_face(image_bytes: bytes) -> Dict:
@@ -19,25 +74,31 @@ def detect_face(image_bytes: bytes) -> Dict:
     try:
         # Converte bytes para array numpy
         nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
-        if img is None:
+        # Decodifica direto em escala de cinza (necessário para Haar Cascade) e, se a
+        # imagem for grande, com metade da resolução: no JPEG a redução é feita pelo
+        # próprio decoder, que pula boa parte do trabalho. O tamanho vem do cabeçalho,
+        # para que cada imagem seja decodificada uma vez só.
+        dimensoes = _dimensoes_imagem(image_bytes)
+        reduzir = dimensoes is not None and min(dimensoes) >= 2 * LADO_MINIMO_DETECCAO
+        if reduzir:
+            gray = cv2.imdecode(nparr, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+        else:
+            gray = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+
+        if gray is None:
             return {"face_detected": False, "face_count": 0}
 
-        # Converte para escala de cinza (necessário para Haar Cascade)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-        # Carrega o classificador Haar Cascade para detecção facial
-        face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        )
+        # Classificador Haar Cascade para detecção facial (já carregado)
+        face_cascade = _get_face_cascade()
 
         # Detecta rostos na imagem
         faces = face_cascade.detectMultiScale(
             gray,
             scaleFactor=1.1,
             minNeighbors=5,
-            minSize=(30, 30),
+            # Na imagem reduzida o rosto mínimo também cai pela metade
+            minSize=(TAMANHO_MINIMO_ROSTO // 2,) * 2 if reduzir else (TAMANHO_MINIMO_ROSTO,) * 2,
             flags=cv2.CASCADE_SCALE_IMAGE
         )
 
@@ -51,3 +112,69 @@ def detect_face(image_bytes: bytes) -> Dict:
     except Exception as e:
         print(f"Erro na detecção facial: {e}")
         return {"face_detected": False, "face_count": 0}
+
+
+def _inicializar_worker() -> None:
+    # Carrega o classificador quando o worker sobe, e não na primeira selfie que ele recebe
+    _get_face_cascade()
+
+
+def _aquecer() -> None:
+    pass
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: o processo do servidor tem threads, fork não é seguro
+                _pool = ProcessPoolExecutor(
+                    max_workers=FACE_DETECTION_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_inicializar_worker
+                )
+    return _pool
+
+
+def detect_face_in_pool(image_bytes: bytes) -> Dict:
+    """
+    Executa detect_face em um processo separado.
+
+    A detecção é CPU-bound e segura o GIL; rodando fora do processo do
+    servidor ela não trava as outras requisições. Se o pool quebrar
+    (ex.: worker morto), detecta no próprio processo.
+    """
+    global _pool
+    pool = _get_pool()
+    try:
+        return pool.submit(detect_face, bytes(image_bytes)).result()
+    except BrokenProcessPool:
+        with _pool_lock:
+            # Outra requisição pode já ter trocado o pool quebrado
+            if _pool is pool:
+                _pool = None
+        # Encerra a thread de gerenciamento e os workers que sobraram
+        pool.shutdown(wait=False, cancel_futures=True)
+        return detect_face(image_bytes)
+
+
+def iniciar_pool_deteccao() -> None:
+    """
+    Sobe os workers do pool na inicialização da aplicação, sem esperar por eles.
+
+    Iniciar um worker (spawn + import do OpenCV + carga do classificador) leva
+    alguns segundos; assim esse custo não cai no primeiro registro de ponto.
+    """
+    pool = _get_pool()
+    for _ in range(FACE_DETECTION_WORKERS):
+        pool.submit(_aquecer)
+
+
+def encerrar_pool_deteccao() -> None:
+    """Encerra os workers do pool (desligamento da aplicação)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
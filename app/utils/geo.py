@@ -1,6 +1,10 @@
-import math
+from math import asin, cos, radians, sin, sqrt
+import numpy as np
 from typing import Tuple
 
+RAIO_TERRA_METROS = 6371000
+DIAMETRO_TERRA_METROS = 2.0 * RAIO_TERRA_METROS
+
 
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
@@ -15,19 +19,47 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     Returns:
         Distância em metros
     """
-    R = 6371000  # Raio da Terra em metros
+    lat1_rad = radians(lat1)
+    lat2_rad = radians(lat2)
+    delta_lat = lat2_rad - lat1_rad
+    delta_lon = radians(lon2 - lon1)
+
+    a = sin(delta_lat * 0.5) ** 2 + \
+        cos(lat1_rad) * cos(lat2_rad) * sin(delta_lon * 0.5) ** 2
+
+    # 2·asin(√a) equivale a 2·atan2(√a, √(1-a)) com uma raiz a menos; o min evita
+    # erro de domínio quando o arredondamento deixa a um pouco acima de 1 (pontos antípodas)
+    return DIAMETRO_TERRA_METROS * asin(sqrt(min(a, 1.0)))
 
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
 
-    a = math.sin(delta_lat / 2) ** 2 + \
-        math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon / 2) ** 2
+def calculate_distance_batch(
+    lat1: float,
+    lon1: float,
+    lats2: np.ndarray,
+    lons2: np.ndarray
+) -> np.ndarray:
+    """
+    Versão vetorizada de calculate_distance: distância de um ponto para vários.
+
+    Args:
+        lat1: Latitude do ponto de origem
+        lon1: Longitude do ponto de origem
+        lats2: Latitudes dos destinos (array)
+        lons2: Longitudes dos destinos (array)
+
+    Returns:
+        Array com as distâncias em metros
+    """
+    lat1_rad = radians(lat1)
+    lats2_rad = np.radians(lats2)
+    delta_lat = lats2_rad - lat1_rad
+    delta_lon = np.radians(lons2 - lon1)
 
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    a = np.sin(delta_lat / 2) ** 2 + \
+        cos(lat1_rad) * np.cos(lats2_rad) * np.sin(delta_lon / 2) ** 2
 
-    return R * c
+    # Mesmo limite da versão escalar: sem ele, pontos antípodas dariam NaN
+    return DIAMETRO_TERRA_METROS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
 
 
 def is_within_radius(
@@ -0,0 +1,20 @@
+from datetime import date, datetime, time
+from typing import Tuple
+
+
+def limites_periodo(data_inicio: date, data_fim: date) -> Tuple[datetime, datetime]:
+    """
+    Converte um período de datas nos limites usados nos filtros de timestamp.
+
+    Os filtros ficam como `timestamp >= inicio AND timestamp <= fim`, que usam
+    o índice (user_id, timestamp) como busca por intervalo. Comparar
+    `func.date(timestamp)` impediria o uso do índice.
+
+    Args:
+        data_inicio: Primeiro dia do período
+        data_fim: Último dia do período (inclusive)
+
+    Returns:
+        Tupla (início do primeiro dia, fim do último dia)
+    """
+    return datetime.combine(data_inicio, time.min), datetime.combine(data_fim, time.max)
@@ -0,0 +1,116 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from email.utils import formatdate
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Receive, Scope, Send
+
+# Tipos de arquivo que valem a pena comprimir (imagens já vêm comprimidas)
+EXTENSOES_COMPRIMIVEIS = frozenset({'.css', '.js', '.json', '.svg', '.html', '.txt', '.webmanifest'})
+
+# Abaixo disso o gzip não compensa (mesmo limite do GZipMiddleware em main.py)
+TAMANHO_MINIMO_GZIP = 1024
+
+
+class ArquivoEstatico(NamedTuple):
+    conteudo: bytes
+    conteudo_gzip: Optional[bytes]
+    etag: str
+    etag_gzip: Optional[str]
+
+
+@lru_cache(maxsize=256)
+def _carregar_arquivo(caminho: str, mtime_ns: int, tamanho: int) -> ArquivoEstatico:
+    # mtime e tamanho fazem parte da chave: arquivo alterado em disco gera nova entrada
+    with open(caminho, 'rb') as f:
+        conteudo = f.read()
+
+    conteudo_gzip = None
+    if len(conteudo) >= TAMANHO_MINIMO_GZIP and os.path.splitext(caminho)[1] in EXTENSOES_COMPRIMIVEIS:
+        conteudo_gzip = gzip.compress(conteudo, compresslevel=9)
+
+    # Cada representação (original e gzip) tem o seu ETag forte
+    hash_conteudo = hashlib.md5(conteudo, usedforsecurity=False).hexdigest()
+    etag_gzip = f'"{hash_conteudo}-gz"' if conteudo_gzip is not None else None
+    return ArquivoEstatico(conteudo, conteudo_gzip, f'"{hash_conteudo}"', etag_gzip)
+
+
+def aceita_gzip(accept_encoding: str) -> bool:
+    """Verifica se o Accept-Encoding aceita gzip, respeitando q=0 (recusado)."""
+    qualidades = {}
+    for item in accept_encoding.lower().split(","):
+        codificacao, *parametros = item.split(";")
+        q = 1.0
+        for parametro in parametros:
+            nome, _, valor = parametro.strip().partition("=")
+            if nome == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        qualidades[codificacao.strip()] = q
+    # gzip explícito tem prioridade sobre o curinga
+    return qualidades.get("gzip", qualidades.get("*", 0.0)) > 0
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles que mantém os arquivos em memória, já comprimidos com gzip.
+
+    Serve para diretórios pequenos e que mudam pouco (CSS/JS do /static): o
+    arquivo é lido e comprimido uma vez (nível máximo) em vez de ser lido do
+    disco e comprimido pelo GZipMiddleware a cada requisição. ETag e
+    Last-Modified continuam permitindo respostas 304.
+    """
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        arquivo = _carregar_arquivo(str(full_path), stat_result.st_mtime_ns, stat_result.st_size)
+
+        headers = {
+            "etag": arquivo.etag,
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        }
+        conteudo = arquivo.conteudo
+        if arquivo.conteudo_gzip is not None:
+            headers["vary"] = "Accept-Encoding"
+            if aceita_gzip(request_headers.get("accept-encoding", "")):
+                # Com Content-Encoding definido, o GZipMiddleware não comprime de novo
+                conteudo = arquivo.conteudo_gzip
+                headers["content-encoding"] = "gzip"
+                headers["etag"] = arquivo.etag_gzip
+
+        if self.is_not_modified(Headers(headers), request_headers):
+            return NotModifiedResponse(Headers(headers))
+
+        media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+        return Response(conteudo, status_code=status_code, headers=headers, media_type=media_type)
+
+
+class QGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware que respeita q=0 no Accept-Encoding.
+
+    O do Starlette comprime sempre que "gzip" aparece no cabeçalho, inclusive
+    em "gzip;q=0", que significa justamente que o cliente recusa gzip.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and not aceita_gzip(Headers(scope=scope).get("accept-encoding", "")):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
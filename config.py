@@ -18,6 +18,27 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./ponto_eletronico.db")
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+# Pool de conexões (PostgreSQL). pool_size + max_overflow deve cobrir o threadpool
+# do FastAPI de cada worker, somado entre os workers abaixo do max_connections do banco
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 20))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 10))  # segundos esperando uma conexão livre
+# Statements compilados guardados pelo SQLAlchemy (o padrão, 500, é pequeno para a
+# quantidade de variações de consulta das rotas; ao encher, volta a compilar SQL)
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", 1200))
+
+# Cria tabelas/colunas/índices que faltam ao iniciar a aplicação.
+# Use AUTO_CREATE_TABLES=0 quando o schema for gerenciado fora da aplicação.
+AUTO_CREATE_TABLES = os.getenv("AUTO_CREATE_TABLES", "1") == "1"
+
+# Quando rodar as migrações: "sync" antes de aceitar requisições, "async" em segundo
+# plano (o servidor responde /healthz enquanto isso) ou "skip" para não rodar
+MIGRATION_MODE = os.getenv("MIGRATION_MODE", "sync" if AUTO_CREATE_TABLES else "skip")
+
+# Detecção de lazy loads (N+1) para desenvolvimento/CI: "warn" registra um aviso,
+# "raise" faz a requisição falhar. Vazio (padrão) desativa; não usar em produção.
+LAZY_LOAD_CHECK = os.getenv("LAZY_LOAD_CHECK", "")
+
 # Configurações de geolocalização padrão (São Paulo)
 DEFAULT_COMPANY_LATITUDE = -23.550520
 DEFAULT_COMPANY_LONGITUDE = -46.633308
@@ -27,5 +48,8 @@ DEFAULT_ALLOWED_RADIUS_METERS = 100
 UPLOAD_FOLDER = "uploads/fotos"
 MAX_CONTENT_LENGTH = 5 * 1024 * 1024  # 5MB
 
+# Processos dedicados à detecção facial
+FACE_DETECTION_WORKERS = int(os.getenv("FACE_DETECTION_WORKERS", 2))
+
 # Porta do servidor (Railway define via variável de ambiente)
 PORT = int(os.getenv("PORT", 8000))
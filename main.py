@@ -1,104 +1,332 @@
-from fastapi import FastAPI, Request, Depends, HTTPException
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import RedirectResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, RedirectResponse
+from contextlib import asynccontextmanager
 from sqlalchemy.orm import Session
-from sqlalchemy import text, inspect
+from sqlalchemy import bindparam, func, insert, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateIndex
+from typing import Dict, Optional, Set
+import asyncio
 import os
+import re
 
-from app.database import engine, Base, get_db, SessionLocal
-from app.models.models import User, CompanySettings, Curso, Location
+from app.database import engine, Base, SessionLocal, aquecer_pool
+from app.models.models import User, CompanySettings, Curso, Location, TimeRecord, Metadado
 from app.routes import auth_router, ponto_router, admin_router, super_admin_router
-from app.utils.auth import get_password_hash
-from config import DEFAULT_COMPANY_LATITUDE, DEFAULT_COMPANY_LONGITUDE, DEFAULT_ALLOWED_RADIUS_METERS, PORT
+from app.utils.auth import buscar_curso_ativo, carregar_cursos_ativos, curso_em_cache, CursoAtivo
+from app.utils.diagnostico import ativar_deteccao_lazy_load
+from app.utils.face import iniciar_pool_deteccao, encerrar_pool_deteccao
+from app.utils.static import CachedStaticFiles, QGZipMiddleware
+from config import DEFAULT_COMPANY_LATITUDE, DEFAULT_COMPANY_LONGITUDE, DEFAULT_ALLOWED_RADIUS_METERS, PORT, UPLOAD_FOLDER, MIGRATION_MODE, LAZY_LOAD_CHECK
 
 
-def run_migrations():
-    """Executa migrações do banco de dados para adicionar novas colunas."""
-    inspector = inspect(engine)
+# Tabelas inspecionadas pelas migrações (todas as dos modelos)
+TABELAS_MIGRADAS = tuple(Base.metadata.tables)
 
-    with engine.connect() as conn:
-        # Detecta se é PostgreSQL ou SQLite
-        is_postgres = 'postgresql' in str(engine.url)
-
-        # Verifica se tabela cursos existe
-        if not inspector.has_table('cursos'):
-            print("Criando tabela cursos...")
-            if is_postgres:
-                conn.execute(text("""
-                    CREATE TABLE cursos (
-                        id SERIAL PRIMARY KEY,
-                        nome VARCHAR(100) NOT NULL,
-                        slug VARCHAR(50) UNIQUE NOT NULL,
-                        ativo BOOLEAN DEFAULT true,
-                        created_at TIMESTAMP DEFAULT NOW(),
-                        updated_at TIMESTAMP DEFAULT NOW()
-                    )
-                """))
-            else:
-                conn.execute(text("""
-                    CREATE TABLE cursos (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        nome VARCHAR(100) NOT NULL,
-                        slug VARCHAR(50) UNIQUE NOT NULL,
-                        ativo BOOLEAN DEFAULT 1,
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                """))
-            conn.commit()
-            print("Tabela cursos criada!")
-
-        # Verifica colunas na tabela users
-        user_columns = [col['name'] for col in inspector.get_columns('users')]
-
-        if 'is_super_admin' not in user_columns:
-            print("Adicionando coluna is_super_admin em users...")
-            if is_postgres:
-                conn.execute(text("ALTER TABLE users ADD COLUMN is_super_admin BOOLEAN DEFAULT false"))
+# Versão do schema esperada pelo código. Incremente ao mudar modelos, colunas ou
+# índices, para que a próxima inicialização rode as migrações.
+SCHEMA_VERSION = 2
+
+# Chaves da tabela ponto_meta
+META_SCHEMA_VERSION = "schema_version"
+META_DADOS_PADRAO = "dados_padrao_criados"
+
+
+def ler_metadados() -> Optional[Dict[str, str]]:
+    """
+    Lê a tabela ponto_meta inteira (uma consulta, sem reflexão).
+
+    Returns:
+        Dicionário chave -> valor, ou None se a tabela ainda não existe
+        (banco novo ou anterior ao controle de versão)
+    """
+    try:
+        with engine.connect() as conn:
+            return dict(conn.execute(select(Metadado.chave, Metadado.valor)).all())
+    except DBAPIError:
+        return None
+
+
+def gravar_metadado(chave: str, valor) -> None:
+    with SessionLocal() as db:
+        db.merge(Metadado(chave=chave, valor=str(valor)))
+        db.commit()
+
+
+# DDL das migrações por dialeto, escolhido uma vez na importação (SQLite ou PostgreSQL)
+_DDL_POR_DIALETO = {
+    'postgresql': {
+        # Colunas de todas as tabelas em uma consulta ao catálogo
+        'consulta_colunas': (
+            "SELECT table_name, column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name IN ("
+            + ", ".join(f"'{tabela}'" for tabela in TABELAS_MIGRADAS) + ")"
+        ),
+        # PostgreSQL aceita várias cláusulas ADD COLUMN no mesmo ALTER TABLE
+        'alter_multiplo': True,
+        # Colunas adicionadas depois da criação das tabelas: tabela -> [(coluna, definição)]
+        'novas_colunas': {
+            'users': [('is_super_admin', 'BOOLEAN DEFAULT false'), ('curso_id', 'INTEGER')],
+            'locations': [('curso_id', 'INTEGER')],
+        },
+    },
+    'sqlite': {
+        'consulta_colunas': " UNION ALL ".join(
+            f"SELECT '{tabela}', name FROM pragma_table_info('{tabela}')"
+            for tabela in TABELAS_MIGRADAS
+        ),
+        'alter_multiplo': False,
+        'novas_colunas': {
+            'users': [('is_super_admin', 'BOOLEAN DEFAULT 0'), ('curso_id', 'INTEGER')],
+            'locations': [('curso_id', 'INTEGER')],
+        },
+    },
+}
+IS_POSTGRES = engine.dialect.name == 'postgresql'
+DDL = _DDL_POR_DIALETO['postgresql' if IS_POSTGRES else 'sqlite']
+
+
+def _colunas_existentes(conn) -> Dict[str, Set[str]]:
+    """
+    Lê as colunas de todas as tabelas migradas em uma única consulta ao catálogo.
+
+    Returns:
+        Dicionário tabela -> colunas; tabelas inexistentes ficam de fora
+    """
+    colunas = {}
+    for tabela, coluna in conn.execute(text(DDL['consulta_colunas'])):
+        colunas.setdefault(tabela, set()).add(coluna)
+    return colunas
+
+
+# Tempo máximo esperando um lock de tabela durante as migrações (PostgreSQL). ALTER TABLE
+# pede ACCESS EXCLUSIVE; sem limite, uma transação longa em andamento faria a migração (e
+# todas as consultas enfileiradas atrás dela) esperar indefinidamente.
+DDL_LOCK_TIMEOUT = '5s'
+
+
+def _criar_indices_concorrentes(tabelas) -> bool:
+    """
+    Cria no PostgreSQL os índices que faltam com CREATE INDEX CONCURRENTLY.
+
+    A criação concorrente não bloqueia escritas na tabela, mas não pode rodar
+    dentro de uma transação, por isso usa uma conexão em autocommit. Sem
+    lock_timeout: antes de terminar, ela espera as transações mais antigas, e
+    um limite curto faria o índice falhar à toa.
+
+    Returns:
+        False se algum índice não pôde ser criado (a migração deve ser repetida)
+    """
+    indices = [index for table in tabelas for index in table.indexes]
+    completo = True
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # Uma criação concorrente que falhou deixa o índice INVALID; com IF NOT EXISTS
+        # ele nunca seria refeito, então os restos inválidos são removidos antes
+        invalidos = conn.execute(text(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE NOT i.indisvalid AND c.relname = ANY(:nomes)"
+        ), {"nomes": [index.name for index in indices]}).scalars().all()
+        for nome in invalidos:
+            print(f"Removendo índice inválido {nome}...")
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{nome}"'))
+
+        for index in indices:
+            ddl = str(CreateIndex(index).compile(dialect=conn.dialect))
+            ddl = re.sub(
+                r"^CREATE (UNIQUE )?INDEX ",
+                r"CREATE \1INDEX CONCURRENTLY IF NOT EXISTS ",
+                ddl
+            )
+            try:
+                conn.execute(text(ddl))
+            except DBAPIError as e:
+                # Não impede a inicialização; o índice é refeito no próximo start
+                print(f"Erro ao criar índice {index.name}: {e}")
+                completo = False
+    return completo
+
+
+def run_migrations() -> bool:
+    """
+    Executa migrações do banco de dados: cria tabelas novas e adiciona colunas e índices.
+
+    Returns:
+        False se algum índice ficou pendente (PostgreSQL)
+    """
+    # Uma única transação: um commit no final, e nada fica pela metade se algo falhar
+    with engine.begin() as conn:
+        if IS_POSTGRES:
+            # Vale só para esta transação
+            conn.execute(text(f"SET LOCAL lock_timeout = '{DDL_LOCK_TIMEOUT}'"))
+
+        # Uma consulta ao catálogo em vez de uma reflexão por tabela
+        colunas = _colunas_existentes(conn)
+
+        # Cria as tabelas que ainda não existem (banco novo ou tabelas novas, como cursos
+        # em bancos antigos) na mesma conexão/transação. As tabelas inexistentes já são
+        # conhecidas pela consulta acima, então o create_all não precisa sondar cada uma.
+        tabelas_novas = [table for table in Base.metadata.sorted_tables if table.name not in colunas]
+        if tabelas_novas:
+            print(f"Criando tabelas: {', '.join(table.name for table in tabelas_novas)}...")
+            Base.metadata.create_all(bind=conn, tables=tabelas_novas, checkfirst=False)
+
+        # Adiciona colunas que faltam em tabelas que já existiam
+        for tabela, definicoes in DDL['novas_colunas'].items():
+            if tabela not in colunas:
+                continue
+            clausulas = [
+                f"ADD COLUMN {coluna} {tipo}"
+                for coluna, tipo in definicoes
+                if coluna not in colunas[tabela]
+            ]
+            if not clausulas:
+                continue
+
+            print(f"Adicionando {len(clausulas)} coluna(s) em {tabela}...")
+            if DDL['alter_multiplo']:
+                conn.execute(text(f"ALTER TABLE {tabela} " + ", ".join(clausulas)))
             else:
-                conn.execute(text("ALTER TABLE users ADD COLUMN is_super_admin BOOLEAN DEFAULT 0"))
-            conn.commit()
-            print("Coluna is_super_admin adicionada!")
-
-        if 'curso_id' not in user_columns:
-            print("Adicionando coluna curso_id em users...")
-            conn.execute(text("ALTER TABLE users ADD COLUMN curso_id INTEGER"))
-            conn.commit()
-            print("Coluna curso_id adicionada em users!")
-
-        # Verifica colunas na tabela locations
-        if inspector.has_table('locations'):
-            location_columns = [col['name'] for col in inspector.get_columns('locations')]
-
-            if 'curso_id' not in location_columns:
-                print("Adicionando coluna curso_id em locations...")
-                conn.execute(text("ALTER TABLE locations ADD COLUMN curso_id INTEGER"))
-                conn.commit()
-                print("Coluna curso_id adicionada em locations!")
+                for clausula in clausulas:
+                    conn.execute(text(f"ALTER TABLE {tabela} {clausula}"))
+            print(f"Colunas adicionadas em {tabela}!")
+
+        # Cria índices declarados nos modelos que ainda não existem nas tabelas que já
+        # existiam (as recém-criadas já vêm com os índices)
+        tabelas_indexadas = [
+            table for table in (User.__table__, Location.__table__, TimeRecord.__table__)
+            if table.name in colunas
+        ]
+        if not IS_POSTGRES:
+            for table in tabelas_indexadas:
+                for index in table.indexes:
+                    index.create(bind=conn, checkfirst=True)
+
+    # No PostgreSQL os índices são criados depois do commit, sem bloquear escritas
+    if IS_POSTGRES and not _criar_indices_concorrentes(tabelas_indexadas):
+        print("Migrações concluídas com índices pendentes")
+        return False
 
     print("Migrações concluídas!")
+    return True
+
+
+def preparar_banco(migrar: bool = True):
+    """Aplica as migrações (se o schema estiver desatualizado) e cria os dados padrão."""
+    # Uma consulta decide o que precisa ser feito; num restart comum, nada além dela
+    metadados = ler_metadados()
+
+    # Com o schema já na versão atual, as migrações (e a consulta ao catálogo) são puladas
+    if migrar and (metadados or {}).get(META_SCHEMA_VERSION) != str(SCHEMA_VERSION):
+        # Cria tabelas novas (inclusive ponto_meta) e adiciona colunas/índices que faltam
+        # Só registra a versão se tudo foi aplicado; senão repete no próximo start
+        if run_migrations():
+            gravar_metadado(META_SCHEMA_VERSION, SCHEMA_VERSION)
+        metadados = metadados or {}
+
+    db = SessionLocal()
+    try:
+        # Dados padrão só são verificados até a primeira vez em que ficam completos. Sem a
+        # tabela ponto_meta (schema gerenciado fora e sem migrações) verifica sempre.
+        if (metadados or {}).get(META_DADOS_PADRAO) != "1":
+            init_db(db)
+            if metadados is not None:
+                gravar_metadado(META_DADOS_PADRAO, "1")
+        associar_orfaos(db)
+
+        # Cursos ativos já ficam em cache para as páginas e rotas por curso
+        carregar_cursos_ativos(db)
+    finally:
+        db.close()
 
+    aquecer_pool()
 
-# Executa migrações antes de criar tabelas
-run_migrations()
 
-# Cria as tabelas no banco de dados (para tabelas novas)
-Base.metadata.create_all(bind=engine)
+async def _preparar_banco_em_background(app: FastAPI):
+    app.state.migration_status = "running"
+    try:
+        await asyncio.to_thread(preparar_banco)
+    except Exception as e:
+        app.state.migration_status = "failed"
+        print(f"Erro nas migrações: {e}")
+        return
+    app.state.migration_status = "done"
+    print("Banco de dados pronto!")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema é criado/atualizado na inicialização, não no import do módulo
+    if MIGRATION_MODE == "async":
+        # O servidor já aceita requisições; /healthz mostra o andamento
+        app.state.migration_status = "pending"
+        app.state.migration_task = asyncio.create_task(_preparar_banco_em_background(app))
+    else:
+        preparar_banco(migrar=MIGRATION_MODE == "sync")
+        app.state.migration_status = "done" if MIGRATION_MODE == "sync" else "skipped"
+
+    app.state.paginas = renderizar_paginas_estaticas()
+
+    # A pasta de fotos é criada uma vez aqui, não a cada registro de ponto
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    # Workers da detecção facial já sobem aquecidos, antes do primeiro registro
+    iniciar_pool_deteccao()
+
+    print("\n" + "="*50)
+    print("PONTO ELETRÔNICO - Sistema iniciado!")
+    print("="*50)
+    print("Acesse: http://localhost:8000")
+    print("Login admin: admin@empresa.com / admin123")
+    print("="*50 + "\n")
+
+    yield
+
+    encerrar_pool_deteccao()
+
 
 app = FastAPI(
     title="Ponto Eletrônico",
     description="Sistema de Controle de Ponto Eletrônico",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
-# Monta arquivos estáticos
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Comprime respostas maiores que 1 KB (listas JSON, relatórios CSV) quando o cliente aceita gzip
+app.add_middleware(QGZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# Desenvolvimento/CI: aponta relacionamentos carregados sob demanda (N+1)
+if LAZY_LOAD_CHECK:
+    ativar_deteccao_lazy_load(raise_=LAZY_LOAD_CHECK == "raise")
+
+# Monta arquivos estáticos (/static fica em memória, já comprimido; fotos são lidas do disco)
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
 # Configura templates
 templates = Jinja2Templates(directory="templates")
 
+# Páginas que não dependem da requisição nem de curso: renderizadas uma vez na
+# inicialização (lifespan) e servidas já prontas
+PAGINAS_ESTATICAS = {
+    "login": ("login.html", {"user": None}),
+    "cadastro": ("cadastro.html", {"user": None}),
+    "dashboard": ("dashboard.html", {"user": {"nome": ""}}),
+    "admin": ("admin.html", {"user": {"nome": "", "is_admin": True}}),
+    "super_admin": ("super_admin.html", {}),
+}
+
+
+def renderizar_paginas_estaticas() -> Dict[str, bytes]:
+    return {
+        nome: templates.get_template(arquivo).render(contexto).encode()
+        for nome, (arquivo, contexto) in PAGINAS_ESTATICAS.items()
+    }
+
 # Registra rotas da API
 app.include_router(auth_router)
 app.include_router(ponto_router)
@@ -106,125 +334,213 @@ app.include_router(admin_router)
 app.include_router(super_admin_router)
 
 
+# Hash bcrypt da senha padrão do super admin ("admin123"), calculado uma vez e fixo
+# aqui: a senha é pública e deve ser trocada, então o salt fixo não enfraquece nada,
+# e a criação do super admin (banco novo, testes) não paga um bcrypt (~300 ms)
+SENHA_HASH_SUPER_ADMIN_PADRAO = '$2b$12$4dVa2nvGTLZ/OCnLzFuAg.9LRSx2hJsZg.3Ja.aiv0Dc2eenDLHSy'
+
+# Linhas por UPDATE/commit ao corrigir dados antigos na inicialização
+TAMANHO_LOTE_ATUALIZACAO = 1000
+
+
+def _atualizar_em_lotes(db: Session, alvos: list, valores: dict):
+    """
+    Aplica o mesmo UPDATE a várias tabelas, em lotes de TAMANHO_LOTE_ATUALIZACAO
+    linhas por tabela, com commit a cada lote.
+
+    Um único UPDATE em uma tabela grande seguraria os locks de todas as linhas até o
+    fim; em lotes, os locks são liberados a cada commit. No PostgreSQL os UPDATEs de
+    todas as tabelas vão em uma só instrução (CTEs com UPDATE ... RETURNING), uma ida
+    ao banco por lote; no SQLite são instruções separadas na mesma transação.
+
+    Args:
+        alvos: Pares (model, filtros); os filtros devem deixar de valer para as
+            linhas já atualizadas, senão o laço não termina
+        valores: Colunas e valores a atualizar
+    """
+    def _update_lote(model, filtros, valores_lote):
+        lote = select(model.id).where(*filtros).limit(TAMANHO_LOTE_ATUALIZACAO).scalar_subquery()
+        return update(model).where(model.id.in_(lote)).values(valores_lote)
+
+    def _valores_cte(model):
+        # Vários UPDATEs na mesma instrução exigem parâmetros com nomes distintos;
+        # o onupdate (updated_at) também é preenchido aqui pelo mesmo motivo
+        tabela = model.__tablename__
+        colunas = {
+            **{c.key: c.onupdate.arg(None) for c in model.__table__.c
+               if c.onupdate is not None and c.onupdate.is_callable},
+            **valores
+        }
+        return {k: bindparam(f"{tabela}_{k}", v) for k, v in colunas.items()}
+
+    pendentes = list(alvos)
+    while pendentes:
+        if IS_POSTGRES:
+            ctes = [
+                _update_lote(model, filtros, _valores_cte(model))
+                .returning(model.id).cte(f"lote_{model.__tablename__}")
+                for model, filtros in pendentes
+            ]
+            contagens = db.execute(select(*(
+                select(func.count()).select_from(cte).scalar_subquery() for cte in ctes
+            ))).one()
+        else:
+            contagens = [
+                db.execute(
+                    _update_lote(model, filtros, valores),
+                    execution_options={"synchronize_session": False}
+                ).rowcount
+                for model, filtros in pendentes
+            ]
+        db.commit()
+        pendentes = [
+            alvo for alvo, contagem in zip(pendentes, contagens)
+            if contagem >= TAMANHO_LOTE_ATUALIZACAO
+        ]
+
+
+def associar_orfaos(db: Session):
+    """
+    Associa usuários/locais órfãos (sem curso) ao curso padrão.
+
+    Roda em toda inicialização, fora da verificação única dos dados padrão: o
+    cadastro sem curso_id e os usuários/locais criados pelo super admin continuam
+    gerando registros sem curso durante o uso.
+    """
+    default_curso_id = db.execute(select(Curso.id).where(Curso.slug == "default")).scalar()
+    if default_curso_id is None:
+        return
+    _atualizar_em_lotes(db, [
+        (User, (User.curso_id == None, User.is_super_admin == False)),
+        (Location, (Location.curso_id == None,)),
+    ], {"curso_id": default_curso_id})
+
+
 def init_db(db: Session):
     """Inicializa o banco de dados com dados padrão"""
-    # Cria curso padrão se não existir
-    default_curso = db.query(Curso).filter(Curso.slug == "default").first()
-    if not default_curso:
-        default_curso = Curso(
-            nome="Curso Padrão",
-            slug="default"
+    # Os dados padrão são inseridos com INSERTs do Core (sem montar objetos do ORM)
+
+    # Uma única consulta verifica os três dados padrão (curso, super admin e configurações)
+    default_curso_id, tem_super_admin, tem_settings = db.execute(select(
+        select(Curso.id).where(Curso.slug == "default").scalar_subquery(),
+        select(User.id).where(User.is_super_admin == True).exists(),
+        select(CompanySettings.id).exists()
+    )).one()
+
+    # Cria curso padrão se não existir. ON CONFLICT DO NOTHING: com vários workers
+    # iniciando juntos, outro processo pode ter criado o curso depois da consulta acima
+    if default_curso_id is None:
+        dialect_insert = pg_insert if db.bind.dialect.name == 'postgresql' else sqlite_insert
+        result = db.execute(
+            dialect_insert(Curso).values(nome="Curso Padrão", slug="default")
+            .on_conflict_do_nothing(index_elements=["slug"])
         )
-        db.add(default_curso)
-        db.flush()
-        print("Curso padrão criado")
+        if result.rowcount:
+            print("Curso padrão criado")
 
     # Cria super admin se não existir
-    super_admin = db.query(User).filter(User.is_super_admin == True).first()
-    if not super_admin:
+    if not tem_super_admin:
         # Verifica se existe admin antigo para converter
         old_admin = db.query(User).filter(User.email == "admin@empresa.com").first()
         if old_admin:
             old_admin.is_super_admin = True
             print("Usuário admin convertido para super admin")
         else:
-            super_admin = User(
+            db.execute(insert(User).values(
                 nome="Super Administrador",
                 email="admin@puc.rio",
                 matricula="SUPERADMIN",
-                senha_hash=get_password_hash("admin123"),
+                senha_hash=SENHA_HASH_SUPER_ADMIN_PADRAO,
                 is_admin=True,
                 is_super_admin=True,
                 ativo=True,
                 curso_id=None  # Super admin não pertence a nenhum curso específico
-            )
-            db.add(super_admin)
+            ))
             print("Super admin criado: admin@puc.rio / admin123")
 
-    # Associa usuários/locais órfãos ao curso padrão
-    db.query(User).filter(
-        User.curso_id == None,
-        User.is_super_admin == False
-    ).update({"curso_id": default_curso.id})
-
-    db.query(Location).filter(Location.curso_id == None).update({"curso_id": default_curso.id})
-
-    settings = db.query(CompanySettings).first()
-    if not settings:
-        settings = CompanySettings(
+    if not tem_settings:
+        db.execute(insert(CompanySettings).values(
             nome_empresa="Minha Empresa",
             latitude=DEFAULT_COMPANY_LATITUDE,
             longitude=DEFAULT_COMPANY_LONGITUDE,
             raio_permitido_metros=DEFAULT_ALLOWED_RADIUS_METERS
-        )
-        db.add(settings)
+        ))
         print("Configurações padrão da empresa criadas")
 
     db.commit()
 
 
-@app.on_event("startup")
-async def startup_event():
-    os.makedirs("uploads/fotos", exist_ok=True)
-    db = SessionLocal()
-    try:
-        init_db(db)
-    finally:
-        db.close()
-
-    print("\n" + "="*50)
-    print("PONTO ELETRÔNICO - Sistema iniciado!")
-    print("="*50)
-    print("Acesse: http://localhost:8000")
-    print("Login admin: admin@empresa.com / admin123")
-    print("="*50 + "\n")
-
-
 @app.get("/")
 async def root():
     return RedirectResponse(url="/login")
 
 
+@app.get("/healthz")
+async def healthz(request: Request):
+    """Responde assim que o servidor sobe; informa o estado das migrações."""
+    migration_status = request.app.state.migration_status
+    status_code = 503 if migration_status == "failed" else 200
+    return ORJSONResponse({"status": "ok", "migrations": migration_status}, status_code=status_code)
+
+
+@app.get("/health/db")
+def health_db():
+    """Verifica a conexão com o banco e mostra o estado do pool de conexões."""
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    return {"status": "ok", "pool": engine.pool.status()}
+
+
 @app.get("/login")
 async def login_page(request: Request):
-    return templates.TemplateResponse("login.html", {"request": request, "user": None})
+    return HTMLResponse(request.app.state.paginas["login"])
 
 
 @app.get("/cadastro")
 async def cadastro_page(request: Request):
-    return templates.TemplateResponse("cadastro.html", {"request": request, "user": None})
+    return HTMLResponse(request.app.state.paginas["cadastro"])
 
 
 @app.get("/dashboard")
 async def dashboard_page(request: Request):
-    return templates.TemplateResponse("dashboard.html", {"request": request, "user": {"nome": ""}})
+    return HTMLResponse(request.app.state.paginas["dashboard"])
 
 
 @app.get("/admin")
 async def admin_page(request: Request):
-    return templates.TemplateResponse("admin.html", {"request": request, "user": {"nome": "", "is_admin": True}})
+    return HTMLResponse(request.app.state.paginas["admin"])
 
 
 # ============= SUPER ADMIN =============
 
 @app.get("/super-admin")
 async def super_admin_page(request: Request):
-    return templates.TemplateResponse("super_admin.html", {"request": request})
+    return HTMLResponse(request.app.state.paginas["super_admin"])
 
 
 # ============= ROTAS POR CURSO =============
 
-def get_curso_or_404(db: Session, curso_slug: str) -> Curso:
-    """Helper para buscar curso ou retornar 404."""
-    curso = db.query(Curso).filter(Curso.slug == curso_slug, Curso.ativo == True).first()
+def _buscar_curso_no_banco(curso_slug: str) -> Optional[CursoAtivo]:
+    with SessionLocal() as db:
+        return buscar_curso_ativo(db, curso_slug)
+
+
+async def get_curso_or_404(curso_slug: str) -> CursoAtivo:
+    """Helper para buscar curso ou retornar 404 (usa o cache de cursos ativos)."""
+    # Uma sessão do banco só é aberta quando o curso não está em cache. As rotas de
+    # página são async e o SQLAlchemy é síncrono: a consulta vai para o threadpool
+    # para não travar o event loop
+    curso = curso_em_cache(curso_slug)
+    if curso is None:
+        curso = await run_in_threadpool(_buscar_curso_no_banco, curso_slug)
     if not curso:
         raise HTTPException(status_code=404, detail="Curso não encontrado")
     return curso
 
 
 @app.get("/{curso_slug}/login")
-async def curso_login_page(request: Request, curso_slug: str, db: Session = Depends(get_db)):
-    curso = get_curso_or_404(db, curso_slug)
+async def curso_login_page(request: Request, curso_slug: str):
+    curso = await get_curso_or_404(curso_slug)
     return templates.TemplateResponse("curso_login.html", {
         "request": request,
         "curso": {"id": curso.id, "nome": curso.nome, "slug": curso.slug}
@@ -232,8 +548,8 @@ async def curso_login_page(request: Request, curso_slug: str, db: Session = Depe
 
 
 @app.get("/{curso_slug}/cadastro")
-async def curso_cadastro_page(request: Request, curso_slug: str, db: Session = Depends(get_db)):
-    curso = get_curso_or_404(db, curso_slug)
+async def curso_cadastro_page(request: Request, curso_slug: str):
+    curso = await get_curso_or_404(curso_slug)
     return templates.TemplateResponse("curso_cadastro.html", {
         "request": request,
         "curso": {"id": curso.id, "nome": curso.nome, "slug": curso.slug}
@@ -241,8 +557,8 @@ async def curso_cadastro_page(request: Request, curso_slug: str, db: Session = D
 
 
 @app.get("/{curso_slug}/dashboard")
-async def curso_dashboard_page(request: Request, curso_slug: str, db: Session = Depends(get_db)):
-    curso = get_curso_or_404(db, curso_slug)
+async def curso_dashboard_page(request: Request, curso_slug: str):
+    curso = await get_curso_or_404(curso_slug)
     return templates.TemplateResponse("dashboard.html", {
         "request": request,
         "user": {"nome": ""},
@@ -251,8 +567,8 @@ async def curso_dashboard_page(request: Request, curso_slug: str, db: Session =
 
 
 @app.get("/{curso_slug}/admin")
-async def curso_admin_page(request: Request, curso_slug: str, db: Session = Depends(get_db)):
-    curso = get_curso_or_404(db, curso_slug)
+async def curso_admin_page(request: Request, curso_slug: str):
+    curso = await get_curso_or_404(curso_slug)
     return templates.TemplateResponse("admin.html", {
         "request": request,
         "user": {"nome": "", "is_admin": True},